@@ -8,39 +8,39 @@ import logging
 # Initialize Logger
 logging.basicConfig(filename=config('LOGGING_FILE'), level=config('LOGGING_LEVEL'))
 
-orderList = []
-hasNextPage = True
-currentPage = 1
-updateStatus = ""  
-while hasNextPage:
-    magentoOrders, totalCount = MagentoHelper.getOrdersByStatus(currentPage)
+def main():
+    orderList = []
+    hasNextPage = True
+    currentPage = 1
+    updateStatus = ""  
+    while hasNextPage:
+        magentoOrders, totalCount = MagentoHelper.getOrdersByStatus(currentPage)
 
-    for order in magentoOrders:
-        orderList.append({"entity_id": order["entity_id"], "increment_id": order["increment_id"], "status": order["status"]})
+        for order in magentoOrders:
+            orderList.append({"entity_id": order["entity_id"], "increment_id": order["increment_id"], "status": order["status"]})
     
-    hasNextPage = False if int(config('MAGENTO_GET_ORDERS_PAGINATION')) == 0 else currentPage<math.ceil(totalCount/int(config('MAGENTO_GET_ORDERS_PAGINATION')))
-    if hasNextPage:
-        currentPage+=1
+        hasNextPage = False if int(config('MAGENTO_GET_ORDERS_PAGINATION')) == 0 else currentPage<math.ceil(totalCount/int(config('MAGENTO_GET_ORDERS_PAGINATION')))
+        if hasNextPage:
+            currentPage+=1
 
-print(orderList)
+    print(orderList)
 
-if not config("BULK_ENABLE", cast=bool):
-    for order in orderList:
-        response, updateStatus = MagentoHelper.setOrderStatus(order["entity_id"], order["increment_id"])
-    # insert the results of the non-bulk operations into order_history table, only if updateStatus is not empty
-    if updateStatus:
-        SQLHelper.insertOrderHistory(orderList, updateStatus)
-
-else:
-    if orderList:
-        jobUuid, updateStatus = MagentoHelper.setOrderStatusBulk(orderList)
-        # insert the orders whose fields have to be updated into order_history table, with all the status set to pending, 
-        # before a get request to retrieve the final status is executed, only if updateStatus is not empty
+    if not config("BULK_ENABLE", cast=bool):
+        for order in orderList:
+            response, updateStatus = MagentoHelper.setOrderStatus(order["entity_id"], order["increment_id"])
+        # insert the results of the non-bulk operations into order_history table, only if updateStatus is not empty
         if updateStatus:
-            SQLHelper.insertOrderHistory(orderList, updateStatus, jobUuid)
-        #updateStatusList = MagentoHelper.getBulkOpStatusCodeOrders(jobUuid) # move into second main
+            SQLHelper.insertOrderHistory(orderList, updateStatus)
+
+    else:
+        if orderList:
+            jobUuid, updateStatus = MagentoHelper.setOrderStatusBulk(orderList)
+            # insert the orders whose fields have to be updated into order_history table, with all the status set to pending, 
+            # before a get request to retrieve the final status is executed, only if updateStatus is not empty
+            if updateStatus:
+                SQLHelper.insertOrderHistory(orderList, updateStatus, jobUuid)
+            #updateStatusList = MagentoHelper.getBulkOpStatusCodeOrders(jobUuid) # move into second main
 
-        
 
 """
 # creditmemoList will be the list containing all the credtimemo, with all the useful information, like shipping address, and the item list
@@ -92,3 +92,7 @@ while hasNextPage:
 for creditmemo in creditmemoList:
     SQLHelper.insertCreditmemoHistory(creditmemo)
 """
+
+
+if __name__ == "__main__":
+    main()
@@ -7,17 +7,29 @@ import logging
 # Initialize Logger
 logging.basicConfig(filename=config('LOGGING_FILE'), level=config('LOGGING_LEVEL'))
 
-try:
-    if config("PR_UPDATE_MODE_EXECUTION") == 'bestsellers':
-        MagentoHelper.procedureUpdateBestsellers(config('PR_UPDATE_BESTSELLERS_WEBSITE_CODE'), config('PR_UPDATE_BESTSELLERS_EVALUATION_DAY'), config('PR_UPDATE_BESTSELLERS_EVALUATION_PRODUCT'))
-    elif config("PR_UPDATE_MODE_EXECUTION") == 'valutazioni':
-        MagentoHelper.procedureUpdateValutazioni(config('PR_UPDATE_VALUTAZIONI_WEBSITE_CODE'), config('PR_UPDATE_VALUTAZIONI_EVALUATION_DAY'))
-        logging.debug(f"Procedure for update valutazioni is completed. Timestamp: {datetime.datetime.now()}")
-    elif config("PR_UPDATE_MODE_EXECUTION") == 'all':
-        MagentoHelper.procedureUpdateBestsellers(config('PR_UPDATE_BESTSELLERS_WEBSITE_CODE'), config('PR_UPDATE_BESTSELLERS_EVALUATION_DAY'), config('PR_UPDATE_BESTSELLERS_EVALUATION_PRODUCT'))
-        MagentoHelper.procedureUpdateValutazioni(config('PR_UPDATE_VALUTAZIONI_WEBSITE_CODE'), config('PR_UPDATE_VALUTAZIONI_EVALUATION_DAY'))
-        logging.debug(f"Procedure for update bestsellers and valutazioni are completed. Timestamp: {datetime.datetime.now()}")
-    else:
-        exit(1)
-except Exception as e:
-    logging.error(f"{e}. Timestamp: {datetime.datetime.now()}")
\ No newline at end of file
+# it returns the exit code of the script; raiseErrors: the errors are raised again after being logged, so that the
+# caller (the scheduler) records the failure
+def main(raiseErrors=False):
+    try:
+        if config("PR_UPDATE_MODE_EXECUTION") == 'bestsellers':
+            MagentoHelper.procedureUpdateBestsellers(config('PR_UPDATE_BESTSELLERS_WEBSITE_CODE'), config('PR_UPDATE_BESTSELLERS_EVALUATION_DAY'), config('PR_UPDATE_BESTSELLERS_EVALUATION_PRODUCT'))
+        elif config("PR_UPDATE_MODE_EXECUTION") == 'valutazioni':
+            MagentoHelper.procedureUpdateValutazioni(config('PR_UPDATE_VALUTAZIONI_WEBSITE_CODE'), config('PR_UPDATE_VALUTAZIONI_EVALUATION_DAY'))
+            logging.debug(f"Procedure for update valutazioni is completed. Timestamp: {datetime.datetime.now()}")
+        elif config("PR_UPDATE_MODE_EXECUTION") == 'all':
+            MagentoHelper.procedureUpdateBestsellers(config('PR_UPDATE_BESTSELLERS_WEBSITE_CODE'), config('PR_UPDATE_BESTSELLERS_EVALUATION_DAY'), config('PR_UPDATE_BESTSELLERS_EVALUATION_PRODUCT'))
+            MagentoHelper.procedureUpdateValutazioni(config('PR_UPDATE_VALUTAZIONI_WEBSITE_CODE'), config('PR_UPDATE_VALUTAZIONI_EVALUATION_DAY'))
+            logging.debug(f"Procedure for update bestsellers and valutazioni are completed. Timestamp: {datetime.datetime.now()}")
+        else:
+            logging.error(f"Unknown PR_UPDATE_MODE_EXECUTION {config('PR_UPDATE_MODE_EXECUTION')}. Timestamp: {datetime.datetime.now()}")
+            if raiseErrors:
+                raise Exception(f"Unknown PR_UPDATE_MODE_EXECUTION {config('PR_UPDATE_MODE_EXECUTION')}")
+            return 1
+    except Exception as e:
+        logging.error(f"{e}. Timestamp: {datetime.datetime.now()}")
+        if raiseErrors:
+            raise
+
+
+if __name__ == "__main__":
+    exit(main() or 0)
@@ -0,0 +1,15 @@
+# A long-running Main method to apply to Magento the stock and price changes pushed by Eglem to ServerAPI.py
+from lib.helper.ProductChangeApplierHelper import ProductChangeApplier
+from decouple import config
+import logging
+
+# Initialize Logger
+logging.basicConfig(filename=config('LOGGING_FILE'), level=config('LOGGING_LEVEL'))
+
+
+def main():
+    ProductChangeApplier().run()
+
+
+if __name__ == "__main__":
+    main()
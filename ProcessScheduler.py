@@ -0,0 +1,52 @@
+# A long-running Main method that replaces the cron invocations of the Process scripts: every script is
+# registered as a job with its own interval and runs on a warm pool of workers, with pooled database connections
+from lib.helper.SchedulerHelper import SchedulerHelper
+from lib.helper.SQLHelper import SQLHelper
+from lib.helper.StockPriceSyncManagerHelper import StockPriceSyncManager
+from lib.helper.ProductChangeApplierHelper import ProductChangeApplier
+from decouple import config
+import logging
+import signal
+import ProcessUpdateStockAndPrice
+import ProcessUpdateStatusBulk
+import ProcessOrderAndCreditMemo
+import ProcessPrBestsellersAndValutazioni
+
+# Initialize Logger
+logging.basicConfig(filename=config('LOGGING_FILE'), level=config('LOGGING_LEVEL'))
+
+
+def main():
+    SQLHelper.enablePooling(config('SCHEDULER_DB_POOL_SIZE', default=8, cast=int))
+
+    # the sharded sync forks a process pool, which is not safe from the threads of the scheduler: the scheduled
+    # runs are never sharded, a run interrupted by a restart is resumed by the next one
+    if config('UPDATE_STOCK_AND_PRICE_SHARDS', default=1, cast=int) > 1:
+        logging.warning("UPDATE_STOCK_AND_PRICE_SHARDS is ignored by the scheduler, the stock and price sync runs as a single process")
+
+    applier = None
+
+    def applyProductChanges():
+        # built at the first run, so that a disabled job does not open the Eglem session pool
+        nonlocal applier
+        if applier is None:
+            applier = ProductChangeApplier()
+        return applier.applyPending()
+
+    scheduler = SchedulerHelper(config('SCHEDULER_WORKERS', default=4, cast=int))
+    scheduler.addJob("update_stock_and_price", lambda: ProcessUpdateStockAndPrice.main(['--resume', '--shards', '1'], raiseErrors=True), config('SCHEDULER_UPDATE_STOCK_AND_PRICE_SECONDS', default=3600, cast=int))
+    scheduler.addJob("update_stock_and_price_fast_lane", lambda: StockPriceSyncManager(lane='fast').run(), config('SCHEDULER_UPDATE_STOCK_AND_PRICE_FAST_LANE_SECONDS', default=0, cast=int))
+    scheduler.addJob("product_changes", applyProductChanges, config('SCHEDULER_PRODUCT_CHANGES_SECONDS', default=0, cast=int))
+    scheduler.addJob("update_status_bulk", lambda: ProcessUpdateStatusBulk.main(raiseErrors=True), config('SCHEDULER_UPDATE_STATUS_BULK_SECONDS', default=300, cast=int))
+    # disabled by default: ProcessOrderAndCreditMemo.py is still a work in progress
+    scheduler.addJob("order_and_creditmemo", ProcessOrderAndCreditMemo.main, config('SCHEDULER_ORDER_AND_CREDITMEMO_SECONDS', default=0, cast=int))
+    scheduler.addJob("pr_bestsellers_and_valutazioni", lambda: ProcessPrBestsellersAndValutazioni.main(raiseErrors=True), config('SCHEDULER_PR_BESTSELLERS_AND_VALUTAZIONI_SECONDS', default=86400, cast=int))
+
+    # SIGTERM and SIGINT let the jobs in progress complete
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: scheduler.stop())
+    scheduler.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,23 @@
-# A simple Main method to launch a Magento API get for retrieving the status code of a bulk operation
-from lib.helper.MagentoHelper import MagentoHelper
-from lib.helper.EglemHelper import EglemHelper
-from lib.helper.SQLHelper import SQLHelper
+# A simple Main method to launch a Magento API get for retrieving the status code of the bulk operations
+# on products, the pending bulks are polled concurrently and their results saved into the product history table
+from lib.helper.BulkStatusPollerHelper import BulkStatusPoller
 from decouple import config
 import logging
+import datetime
 
 # Initialize Logger
 logging.basicConfig(filename=config('LOGGING_FILE'), level=config('LOGGING_LEVEL'))
 
-uuidList = SQLHelper.getProductHistoryStatus('p')
-# it launches a get request to the magento endpoint related to bulk operations, and
-# save the list of resulting operations into a product history database table
-print(uuidList)
-for uuid in uuidList:
-    print(uuid[0])
-    updateStatusList = MagentoHelper.getBulkOpStatusCode(uuid[0])
+# raiseErrors: the errors are raised again after being logged, so that the caller (the scheduler) records the failure
+def main(raiseErrors=False):
+    try:
+        stats = BulkStatusPoller().run()
+        logging.info(f"Update status bulk complete. Bulks polled: {stats['uuids']}, completed: {stats['uuids_done']}, still pending: {stats['backlog']}, operations: {stats['operations']} ({stats['operations_per_second']}/s). Timestamp: {datetime.datetime.now()}")
+    except Exception as ex:
+        logging.error(f"An exception has been thrown during the poll of the bulk operations: {str(ex)}")
+        if raiseErrors:
+            raise
 
-    # update product_history table only if the status code associated to one or more products has changed, from an earlier bulk operation
-    if updateStatusList:
-        SQLHelper.updateProductHistoryBulk(updateStatusList)
+
+if __name__ == "__main__":
+    main()
@@ -1,81 +1,49 @@
 # A simple Main method to update the products' price and stock quantity
-from lib.helper.MagentoHelper import MagentoHelper
-from lib.helper.EglemHelper import EglemHelper
-from lib.helper.BorderDbHelper import BorderDbHelper
+from lib.helper.StockPriceSyncManagerHelper import StockPriceSyncManager
+from lib.helper.StockPriceSyncHelper import StockPriceSyncHelper
+from lib.helper.StockPriceSyncReportHelper import StockPriceSyncReport
 from decouple import config
-import math
 import logging
 import datetime
+import argparse
 
-itemListPrice, itemListQuantity = [], []
-hasNextPage, currentPage = True, 1
-connectionBorder = BorderDbHelper.getConnection()
-pagination_limit = config('MAGENTO_GET_PRODUCTS_PAGINATION', cast=int)
+# Initialize Logger
+logging.basicConfig(filename=config('LOGGING_FILE'), level=config('LOGGING_LEVEL'))
 
-tuplePriceList = []
-tupleQuantityList = []
-itemPriceList = []
-itemQuantityList = []
+# argv: the command line options, None for the ones of the process; raiseErrors: the errors are raised again after
+# being logged, so that the caller (the scheduler) records the failure
+def main(argv=None, raiseErrors=False):
+    parser = argparse.ArgumentParser(description="Update the products' price and stock quantity")
+    parser.add_argument('--resume', action='store_true', help="continue the last interrupted run from its last checkpoint")
+    parser.add_argument('--shard', type=StockPriceSyncHelper.parseShard, help="sync only the shard index/count of the products, e.g. 0/4 (one process of a multi-host run)")
+    parser.add_argument('--shards', type=int, default=config('UPDATE_STOCK_AND_PRICE_SHARDS', default=1, cast=int), help="sync all the products as this number of shards, each one in its own process")
+    parser.add_argument('--lane', choices=['full', 'fast'], default='full', help="full: all the products, fast: only the hot ones (low stock, recently ordered, bestsellers)")
+    parser.add_argument('--lanes', action='store_true', help="run forever the fast lane and the full pass, each one at its own interval")
+    parser.add_argument('--dry-run', action='store_true', help="write a report of the differences between Magento and Eglem without updating Magento")
+    args = parser.parse_args(argv)
+    if (args.shard or args.shards > 1) and config('UPDATE_STOCK_AND_PRICE_PRODUCT_SOURCE', default='api') != 'database':
+        parser.error("--shard and --shards require UPDATE_STOCK_AND_PRICE_PRODUCT_SOURCE=database")
 
-logging.debug(f"Start Process for update stock and price. Mode Exection:{config('UPDATE_STOCK_AND_PRICE_MODE_EXECUTION')}. Timestamp: {datetime.datetime.now()}")
-try:
-    while hasNextPage:
-        magentoProducts, totalCount = MagentoHelper.getEglemProducts(currentPage)
-        productMap = {
-            [attr["value"] for attr in product["custom_attributes"] if attr["attribute_code"] == 'id_eglem'][0]: product
-            for product in magentoProducts
-        }
-        productIds = list(productMap.keys())
-        eglemProducts = EglemHelper.getProducts(productIds)
+    try:
+        if args.dry_run:
+            stats = StockPriceSyncReport().run()
+        elif args.lanes:
+            # it never returns, each lane logs its own runs
+            StockPriceSyncManager.runLanes()
+        elif args.lane == 'fast':
+            stats = StockPriceSyncManager(lane='fast').run()
+        elif args.shard:
+            stats = StockPriceSyncManager(resume=args.resume, shard=args.shard).run()
+        elif args.shards > 1:
+            stats = StockPriceSyncManager.runShards(args.shards, resume=args.resume)
+        else:
+            stats = StockPriceSyncManager(resume=args.resume).run()
+        logging.info(f"Update stock and price complete: {stats}. Timestamp: {datetime.datetime.now()}")
+    except Exception as ex:
+        logging.error(f"An exception has been thrown during the update of stock and price: {str(ex)}")
+        if raiseErrors:
+            raise
 
-        for eglemProduct in eglemProducts:
-            idEg = eglemProduct['id']
-            magentoProduct = productMap[idEg]
-            sku = magentoProduct["sku"]
-            price, quantity = eglemProduct["prezzo"], int(eglemProduct["quantita"])
-            priceMagento = magentoProduct["price"]
 
-            if config('UPDATE_STOCK_AND_PRICE_MODE_EXECUTION') == 'database':
-                tuplePriceList.append(f"('{sku}' , {price})")
-                itemListPrice.append({"sku": sku, "id_eglem": idEg, "price": price, "quantity": None})
-                tupleQuantityList.append(f"('{sku}' , {quantity})")
-                itemListQuantity.append({"sku": sku, "id_eglem": idEg, "price": None, "quantity": quantity})
-                continue
-            elif config('UPDATE_STOCK_AND_PRICE_MODE_EXECUTION') == 'bulk':
-                if price != priceMagento:
-                    itemListPrice.append({"sku": sku, "id_eglem": idEg, "price": price, "quantity": None})
-                    BorderDbHelper.insertProductHistory(sku, idEg, None, quantity, updateStatusQuantity, None, {"connection": connectionBorder, "close": False})
-                itemListQuantity.append({"sku": sku, "id_eglem": idEg, "price": None, "quantity": quantity})
-                continue
-            elif config('UPDATE_STOCK_AND_PRICE_MODE_EXECUTION') == 'api':
-                if price != priceMagento:
-                    updateStatusPrice = MagentoHelper.setPriceProduct(sku, price)
-                    BorderDbHelper.insertProductHistory(sku, idEg, price, None, updateStatusPrice, None, {"connection": connectionBorder, "close": False})
-                updateStatusQuantity = MagentoHelper.setStockProduct(sku, quantity)
-
-        hasNextPage = pagination_limit > 0 and currentPage < math.ceil(totalCount / pagination_limit)
-        currentPage += 1 if hasNextPage else 0
-
-    if config('UPDATE_STOCK_AND_PRICE_MODE_EXECUTION') == 'database':
-        if tuplePriceList or tupleQuantityList:
-            connectionMagento = MagentoHelper.getConnection()
-            # INSERT PRICE
-            MagentoHelper.setPriceProductDatabase(",".join(tuplePriceList), config("UPDATE_PRICE_WEBSITE_CODE"), config('UPDATE_PRICE_GLOBAL_WEBSITE_CODE'), {"connection": connectionMagento, "close": False})
-            BorderDbHelper.insertProductsHistory(itemListPrice, 'c', None, {"connection": connectionBorder, "close": False})
-            logging.info(f"Update Price complete. Timestamp: {datetime.datetime.now()}")
-            # INSERT QUANTITY
-            MagentoHelper.setStockProductDatabase(",".join(tupleQuantityList), config("UPDATE_STOCK_WEBSITE_CODE"),  config("STATUS_ORDER_FOR_EXCLUDE_QUANTITY"),  config("METHOD_PAYMENT_FOR_EXCLUDE_QUANTITY"), {"connection": connectionMagento, "close": True})
-            BorderDbHelper.insertProductsHistory(itemListQuantity, 'c', None, {"connection": connectionBorder, "close": False})
-            logging.info(f"Update Stock complete. Timestamp: {datetime.datetime.now()}")
-    elif config('UPDATE_STOCK_AND_PRICE_MODE_EXECUTION') == 'bulk':
-        if itemListPrice:
-            jobUuidPrice, updateStatusPrice = MagentoHelper.setPriceProductBulk(itemListPrice)
-            BorderDbHelper.insertProductsHistory(itemListPrice, updateStatusPrice, jobUuidPrice, {"connection": connectionBorder, "close": False})
-        if itemListQuantity:
-            jobUuidQuantity, updateStatusQuantity = MagentoHelper.setStockProductBulk(itemListQuantity)
-            BorderDbHelper.insertProductsHistory(itemListQuantity, updateStatusQuantity, jobUuidQuantity, {"connection": connectionBorder, "close": False})
-except Exception as ex:
-    logging.error("An exception has been thrown during the insertion into database: ", str(ex))
-finally:
-    BorderDbHelper.connectionClose(connectionBorder)
-    logging.debug(f"Finish Process. Timestamp: {datetime.datetime.now()}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
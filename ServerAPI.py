@@ -3,9 +3,11 @@ from fastapi import Depends, FastAPI, Body, Response, HTTPException
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from lib.server.controller.OrderController import OrderController
+from lib.server.controller.ProductController import ProductController
 from lib.server.model.EglemAPIOrderModel import OrderResponse
+from lib.server.model.EglemAPIProductModel import ProductChange
 from lib.server.model.ResponseHttpModel import ResponseHttp
-from typing import List, Dict
+from typing import List, Dict, Union
 from lib.auth.Auth import Auth
 import logging
 from decouple import config
@@ -36,6 +38,11 @@ def addTrackings(token: str = Depends(Auth.verify_token), data: List[Dict[str, s
     response = OrderController.addTrackings(data, token)
     return JSONResponse(status_code=response.get('status_code'), content=response.get('content'))
 
+@app.post("/product/changes")
+def pushProductChanges(token: str = Depends(Auth.verify_token), changes: Union[ProductChange, List[ProductChange]] = Body(None, alias=None, title=None, description="An object, or a list of objects, with the Eglem id of a product and its new prezzo and/or quantita")):
+    response = ProductController.pushChanges(changes)
+    return JSONResponse(status_code=response.get('status_code'), content=response.get('content'))
+
 
 
 if __name__ == "__main__":
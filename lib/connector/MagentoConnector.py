@@ -31,24 +31,27 @@ class MagentoConnector:
 
     # === API Calls ===
     @staticmethod
-    def apiCall(method, urlPath, data=None, options={"externalToken": False, "accessToken": None}):
+    def apiCall(method, urlPath, data=None, options={"externalToken": False, "accessToken": None}, fields=None):
         """
-        Executes generic API call to Magento
+        Executes generic API call to Magento, fields limits the response to a projection (e.g. items[sku,price],total_count)
         """
+        params = data if method.lower() == 'get' else None
+        if fields:
+            params = dict(params or {}, fields=fields)
         return requests.request(
             method.upper(),
             f"{MagentoConnector._getHost()}{urlPath}",
             headers=MagentoConnector._getHeaders(options),
-            params=data if method.lower() == 'get' else None,
+            params=params,
             json=data if method.lower() != 'get' else None,
         )
 
     @staticmethod
-    def apiGet(endpoint, options={"externalToken": False, "accessToken": None}):
+    def apiGet(endpoint, options={"externalToken": False, "accessToken": None}, fields=None):
         """
-        Executes GET API
+        Executes GET API, optionally limited to the fields projection
         """
-        response = MagentoConnector.apiCall("GET", endpoint, None, options)
+        response = MagentoConnector.apiCall("GET", endpoint, None, options, fields)
         return response.json() if response.status_code == 200 else None
 
     @staticmethod
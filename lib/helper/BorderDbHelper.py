@@ -86,45 +86,254 @@ class BorderDbHelper(SQLHelper):
             if options["close"]:
                 BorderDbHelper.connectionClose(connection)
 
+    # SQL SELECT of the last price and quantity pushed to Magento for a list of skus,
+    # returned as a dictionary keyed by sku
+    @staticmethod
+    def getProductSnapshots(skuList, options={"connection":None, "close":True}):
+        snapshots = {}
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            if skuList:
+                cursor = connection.cursor(dictionary=True)
+                placeholders = ", ".join(["%s"] * len(skuList))
+                selectQuery = f"SELECT sku, id_eglem, price, quantity, hash, timestamp FROM product_snapshot WHERE sku IN ({placeholders})"
+                cursor.execute(selectQuery, tuple(skuList))
+                snapshots = {row["sku"]: row for row in cursor.fetchall()}
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the retrieval of the product snapshots: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+            return snapshots
+
+    # SQL upsert of the price and quantity just pushed to Magento into product_snapshot table
+    @staticmethod
+    def upsertProductSnapshots(snapshotList, options={"connection":None, "close":True}):
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            if snapshotList:
+                cursor = connection.cursor()
+                row_data = [
+                    (snapshot['sku'], snapshot['id_eglem'], snapshot['price'], snapshot['quantity'], snapshot['hash'])
+                    for snapshot in snapshotList
+                ]
+                upsertQuery = """
+                    INSERT INTO product_snapshot (
+                        sku,
+                        id_eglem,
+                        price,
+                        quantity,
+                        hash
+                    )
+                    VALUES (
+                        %s,
+                        %s,
+                        %s,
+                        %s,
+                        %s
+                    )
+                    ON DUPLICATE KEY UPDATE
+                        id_eglem=VALUES(id_eglem),
+                        price=VALUES(price),
+                        quantity=VALUES(quantity),
+                        hash=VALUES(hash),
+                        timestamp=CURRENT_TIMESTAMP
+                """
+                cursor.executemany(upsertQuery, row_data)
+                connection.commit()
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the upsert of the product snapshots: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+
+    # SQL SELECT of all the snapshots, streamed in chunks of chunkSize rows (used by the dry run report)
+    @staticmethod
+    def getAllProductSnapshots(chunkSize=10000, options={"connection":None, "close":True}):
+        snapshots = []
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("SELECT sku, id_eglem, price, quantity, timestamp FROM product_snapshot")
+            rows = cursor.fetchmany(chunkSize)
+            while rows:
+                snapshots.extend(rows)
+                rows = cursor.fetchmany(chunkSize)
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the retrieval of the product snapshots: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+            return snapshots
+
+    # SQL SELECT of the snapshots of a list of Eglem ids, returned as a dictionary keyed by id_eglem
+    @staticmethod
+    def getProductSnapshotsByIdEglem(idEglemList, options={"connection":None, "close":True}):
+        snapshots = {}
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            if idEglemList:
+                cursor = connection.cursor(dictionary=True)
+                placeholders = ", ".join(["%s"] * len(idEglemList))
+                selectQuery = f"SELECT sku, id_eglem, price, quantity, hash, timestamp FROM product_snapshot WHERE id_eglem IN ({placeholders})"
+                cursor.execute(selectQuery, tuple([str(idEglem) for idEglem in idEglemList]))
+                snapshots = {row["id_eglem"]: row for row in cursor.fetchall()}
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the retrieval of the product snapshots: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+            return snapshots
+
+    # SQL DELETE of the snapshots of some skus, so that the next run pushes them again
+    @staticmethod
+    def deleteProductSnapshots(skuList, options={"connection":None, "close":True}):
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            if skuList:
+                cursor = connection.cursor()
+                placeholders = ", ".join(["%s"] * len(skuList))
+                cursor.execute(f"DELETE FROM product_snapshot WHERE sku IN ({placeholders})", tuple(skuList))
+                connection.commit()
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the deletion of the product snapshots: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+
+    # SQL insertion of a new stock and price sync run into sync_run table, with status 'r' (running)
+    @staticmethod
+    def insertSyncRun(mode, shard='', lane='full', options={"connection":None, "close":True}):
+        runId = None
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            cursor = connection.cursor()
+            cursor.execute("INSERT INTO sync_run (mode, shard, lane, status) VALUES (%s, %s, %s, 'r')", (mode, shard, lane))
+            connection.commit()
+            runId = cursor.lastrowid
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the insertion of the sync run: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+            return runId
+
+    # SQL SELECT of the last stock and price sync run of a mode, shard (e.g. '0/4', empty when not sharded) and lane (full, fast)
+    @staticmethod
+    def getLastSyncRun(mode, shard='', lane='full', options={"connection":None, "close":True}):
+        syncRun = None
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM sync_run WHERE mode = %s AND shard = %s AND lane = %s ORDER BY id DESC LIMIT 1", (mode, shard, lane))
+            syncRun = cursor.fetchone()
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the retrieval of the last sync run: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+            return syncRun
+
+    # SQL update of the status, the checkpoint (last page whose writes are committed) and the counts of a sync run
+    @staticmethod
+    def updateSyncRun(runId, status, lastPage, counts, options={"connection":None, "close":True}):
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            cursor = connection.cursor()
+            updateQuery = """
+                UPDATE sync_run
+                SET
+                    status = %s,
+                    last_page = %s,
+                    products = %s,
+                    unchanged = %s,
+                    price_changed = %s,
+                    quantity_changed = %s
+                WHERE id = %s
+            """
+            cursor.execute(updateQuery, (status, lastPage, counts['products'], counts['unchanged'], counts['price_changed'], counts['quantity_changed'], runId))
+            connection.commit()
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the update of the sync run {runId}: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+
     # SQL SELECT to retrieve all the jobuuid with pending values from product_history table
     @staticmethod
     def getProductHistoryStatus(status, options={"connection":None,"close":True}):
+        queryResult = []
         try:
-            connection = options["connection"] if options["connection"] else SQLHelper.getConnection()
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
             cursor = connection.cursor()
-            selectQuery = f"SELECT DISTINCT jobuuid FROM product_history ph WHERE ph.status='{status}'"
-            cursor.execute(selectQuery)
+            cursor.execute("SELECT DISTINCT jobuuid FROM product_history ph WHERE ph.status=%s AND ph.jobuuid IS NOT NULL", (status,))
             queryResult = cursor.fetchall()
         except Exception as ex:
-            logging.error(f"An exception has been thrown during the retrieval of products with status={status}: ", str(ex))
-        
+            logging.error(f"An exception has been thrown during the retrieval of products with status={status}: {str(ex)}")
+
         finally:
             if options["close"]:
-                SQLHelper.connectionClose(connection)
+                BorderDbHelper.connectionClose(connection)
             return queryResult
         
 
-    # SQL insertion into product_history table (by direct update or bulk operation)
+    # SQL update of the status of the product_history rows of some bulk operations ({bulk_uuid, sku, status}): the statuses
+    # are loaded into a temporary table with chunked parameterized inserts, then applied with a single joined UPDATE for
+    # each bulk uuid, backed by the (jobuuid, sku) index. It raises an exception when the update fails
     @staticmethod
-    def updateProductHistoryBulk(updateStatusList, options={"connection":None,"close":True}):
+    def updateProductHistoryBulk(updateStatusList, options={"connection":None,"close":True}, chunkSize=None):
+        chunkSize = chunkSize or config('BORDER_DB_STAGING_CHUNK_SIZE', default=1000, cast=int)
+        rowsModified = 0
+        connection = None
         try:
-            connection = options["connection"] if options["connection"] else SQLHelper.getConnection()
-            cursor = connection.cursor()
-            # Cycle through each update status in the list
-            for updateStatus in updateStatusList:
-                 # Construct the SQL query for each item in the list
-                inserQuery = f"UPDATE product_history SET status='{updateStatus['status']}', timestamp=CURRENT_TIMESTAMP WHERE sku='{updateStatus['sku']}' AND jobuuid='{updateStatus['bulk_uuid']}'"
-                cursor.execute(inserQuery)
-            if not options["connection"]:
-                connection.commit()
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            if updateStatusList:
+                cursor = connection.cursor()
+                cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_product_history_status")
+                cursor.execute("CREATE TEMPORARY TABLE tmp_product_history_status (jobuuid varchar(100) NOT NULL, sku varchar(100) NOT NULL, status varchar(100) NOT NULL, PRIMARY KEY (jobuuid, sku))")
+                rows = [(updateStatus['bulk_uuid'], updateStatus['sku'], updateStatus['status']) for updateStatus in updateStatusList]
+                insertQuery = "INSERT INTO tmp_product_history_status (jobuuid, sku, status) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE status=VALUES(status)"
+                for index in range(0, len(rows), chunkSize):
+                    cursor.executemany(insertQuery, rows[index:index + chunkSize])
+
+                for jobUuid in dict.fromkeys([row[0] for row in rows]):
+                    cursor.execute("""
+                        UPDATE product_history ph
+                        INNER JOIN tmp_product_history_status tphs ON tphs.jobuuid = ph.jobuuid AND tphs.sku = ph.sku
+                        SET ph.status = tphs.status, ph.timestamp = CURRENT_TIMESTAMP
+                        WHERE ph.jobuuid = %s AND tphs.jobuuid = %s
+                    """, (jobUuid, jobUuid))
+                    rowsModified += cursor.rowcount
+                cursor.execute("DROP TEMPORARY TABLE IF EXISTS tmp_product_history_status")
+                if not options["connection"]:
+                    connection.commit()
 
         except Exception as ex:
-            logging.error("An exception has been thrown during the bulk update into database: ", str(ex))
+            if connection and not options["connection"]:
+                connection.rollback()
+            raise Exception(f"Error on bulk update of the product history: {str(ex)}")
 
         finally:
             if options["close"]:
-                SQLHelper.connectionClose(connection)
-        
+                BorderDbHelper.connectionClose(connection)
+        return rowsModified
+
 
     # SQL insertion into order_history table (by direct update or bulk operation)
     @staticmethod
@@ -213,3 +422,133 @@ class BorderDbHelper(SQLHelper):
         finally:
             if options["close"]:
                 SQLHelper.connectionClose(connection)
+
+    # SQL insertion of the stock and price changes pushed by Eglem into product_change_queue table, with status
+    # 'p' (pending); it returns the number of queued changes
+    @staticmethod
+    def insertProductChanges(changeList, options={"connection":None, "close":True}):
+        rowCount = 0
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            if changeList:
+                cursor = connection.cursor()
+                row_data = [
+                    (str(change['id_eglem']), change.get('sku'), change.get('price'), change.get('quantity'))
+                    for change in changeList
+                ]
+                insertQuery = """
+                    INSERT INTO product_change_queue (
+                        id_eglem,
+                        sku,
+                        price,
+                        quantity
+                    )
+                    VALUES (
+                        %s,
+                        %s,
+                        %s,
+                        %s
+                    )
+                """
+                cursor.executemany(insertQuery, row_data)
+                connection.commit()
+                rowCount = len(row_data)
+
+        except Exception as ex:
+            raise Exception(f"Error on insert of the product changes: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+        return rowCount
+
+    # SQL SELECT of the oldest pending changes of product_change_queue table
+    @staticmethod
+    def getPendingProductChanges(limit, options={"connection":None, "close":True}):
+        changes = []
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("SELECT id, id_eglem, sku, price, quantity FROM product_change_queue WHERE status = 'p' ORDER BY id LIMIT %s", (limit,))
+            changes = cursor.fetchall()
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the retrieval of the pending product changes: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+            return changes
+
+    # SQL update of the status of some changes of product_change_queue table: 'c' applied, 'e' not applicable
+    @staticmethod
+    def updateProductChangesStatus(idList, status, options={"connection":None, "close":True}):
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            if idList:
+                cursor = connection.cursor()
+                placeholders = ", ".join(["%s"] * len(idList))
+                cursor.execute(f"UPDATE product_change_queue SET status = %s, processed_at = CURRENT_TIMESTAMP WHERE id IN ({placeholders})", (status, *idList))
+                connection.commit()
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the update of the product changes: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+
+    # SQL insertion of the entity_id whose reindex has not been notified yet (MAGENTO_REINDEX_MODE=command) into
+    # pending_reindex table. It raises an exception when the insertion fails
+    @staticmethod
+    def insertPendingReindex(indexer, entityIds, options={"connection":None, "close":True}):
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            if entityIds:
+                cursor = connection.cursor()
+                cursor.executemany("INSERT IGNORE INTO pending_reindex (indexer, entity_id) VALUES (%s, %s)", [(indexer, entityId) for entityId in entityIds])
+                connection.commit()
+
+        except Exception as ex:
+            raise Exception(f"Error on insert of the pending reindex: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+
+    # SQL SELECT of the entity_id whose reindex is still to notify
+    @staticmethod
+    def getPendingReindex(indexer, options={"connection":None, "close":True}):
+        entityIds = []
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            cursor = connection.cursor()
+            cursor.execute("SELECT entity_id FROM pending_reindex WHERE indexer = %s", (indexer,))
+            entityIds = [row[0] for row in cursor.fetchall()]
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the retrieval of the pending reindex: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
+            return entityIds
+
+    # SQL DELETE of the entity_id whose reindex has been notified
+    @staticmethod
+    def deletePendingReindex(indexer, entityIds, chunkSize=1000, options={"connection":None, "close":True}):
+        try:
+            connection = options["connection"] if options["connection"] else BorderDbHelper.getConnection()
+            cursor = connection.cursor()
+            for index in range(0, len(entityIds), chunkSize):
+                chunk = entityIds[index:index + chunkSize]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(f"DELETE FROM pending_reindex WHERE indexer = %s AND entity_id IN ({placeholders})", (indexer, *chunk))
+            connection.commit()
+
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the deletion of the pending reindex: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                BorderDbHelper.connectionClose(connection)
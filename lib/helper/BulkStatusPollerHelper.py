@@ -0,0 +1,85 @@
+import logging
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decouple import config
+from lib.helper.MagentoHelper import MagentoHelper
+from lib.helper.BorderDbHelper import BorderDbHelper
+
+class BulkStatusPoller:
+    """
+    Poller of the Magento bulks on products still pending into product_history: the detailed status of
+    the bulks is requested concurrently by a bounded pool of workers, and the result of each bulk is
+    written and committed as soon as it arrives, so that an interrupted poll keeps the work already done
+    """
+
+    def __init__(self, workers=None):
+        self.workers = max(1, workers or config('UPDATE_STATUS_BULK_WORKERS', default=8, cast=int))
+        self.stats = {
+            'uuids': 0,
+            'uuids_done': 0,
+            'uuids_failed': 0,
+            'operations': 0,
+            'operations_open': 0,
+            'rows_updated': 0,
+            'backlog': 0,
+            'seconds': 0.0,
+            'uuids_per_second': 0.0,
+            'operations_per_second': 0.0
+        }
+
+    def run(self):
+        """
+        Poll all the pending bulks once
+
+        Returns:
+            dict: Statistics of the poll, backlog is the number of bulks still pending after it
+        """
+        start = time.perf_counter()
+        uuidList = [row[0] for row in BorderDbHelper.getProductHistoryStatus('p')]
+        self.stats['uuids'] = len(uuidList)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bulk") as executor:
+            futures = {executor.submit(self.pollBulk, uuid): uuid for uuid in uuidList}
+            for future in as_completed(futures):
+                try:
+                    operations, openOperations, rowsUpdated = future.result()
+                    self.stats['operations'] += operations
+                    self.stats['operations_open'] += openOperations
+                    self.stats['rows_updated'] += rowsUpdated
+                    # a bulk with open operations is polled again by the next run
+                    self.stats['uuids_done'] += 0 if openOperations else 1
+                except Exception as ex:
+                    self.stats['uuids_failed'] += 1
+                    logging.error(f"An exception has been thrown during the poll of the bulk {futures[future]}: {str(ex)}")
+
+        seconds = time.perf_counter() - start
+        self.stats['backlog'] = self.stats['uuids'] - self.stats['uuids_done']
+        self.stats['seconds'] = round(seconds, 3)
+        self.stats['uuids_per_second'] = round(self.stats['uuids'] / seconds, 2) if seconds else 0.0
+        self.stats['operations_per_second'] = round(self.stats['operations'] / seconds, 2) if seconds else 0.0
+        logging.info(f"Poll of the bulk operations complete: {self.stats}. Timestamp: {datetime.datetime.now()}")
+        return self.stats
+
+    # the status of the operations of a bulk, written into product_history with its own connection and
+    # transaction. It returns the number of operations, of the ones still open and of the statuses written
+    def pollBulk(self, uuid):
+        operations, openOperations = 0, 0
+        updateStatusList = []
+        for sku, status in MagentoHelper.iterBulkOpStatus(uuid):
+            operations += 1
+            if status is None:
+                openOperations += 1
+            else:
+                updateStatusList.append({"bulk_uuid": uuid, "sku": sku, "status": status})
+
+        if updateStatusList:
+            connection = BorderDbHelper.getConnection()
+            try:
+                BorderDbHelper.updateProductHistoryBulk(updateStatusList, {"connection": connection, "close": False})
+                connection.commit()
+                # the skus whose operation ended with an error are pushed again by the next stock and price run
+                BorderDbHelper.deleteProductSnapshots([updateStatus['sku'] for updateStatus in updateStatusList if updateStatus['status'] == 'e'], {"connection": connection, "close": False})
+            finally:
+                BorderDbHelper.connectionClose(connection)
+        return operations, openOperations, len(updateStatusList)
@@ -2,6 +2,10 @@ import requests
 from decouple import config
 import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 class EglemHelper:
 
@@ -15,16 +19,20 @@ class EglemHelper:
             "Authorization": f"Bearer {config('EGLEM_TOKEN')}"
         }
 
+    @staticmethod
+    def _getProductsPayload(idList):
+        return {
+            'token': config('EGLEM_TOKEN'),
+            'act': 'get_dati_da_lista_prodotti',
+            'dati': '["quantita","prezzo"]',
+            'list': json.dumps(idList)
+        }
+
     # a method to get all the products from Eglem, referenced by a list
     def getProducts(idList):
         data_res = []
         try:
-            payload = {
-                'token': config('EGLEM_TOKEN'),
-                'act': 'get_dati_da_lista_prodotti',
-                'dati': '["quantita","prezzo"]',
-                'list': json.dumps(idList)
-            }
+            payload = EglemHelper._getProductsPayload(idList)
             response = requests.request(
                 "POST", 
                 EglemHelper._getHost(), 
@@ -43,4 +51,162 @@ class EglemHelper:
 
         finally:
             return data_res
-        
\ No newline at end of file
+        
+
+
+class EglemClient:
+    """
+    Client for the Eglem product lists: the ids are split in batches of its own size, independent
+    of the Magento paging, and the size adapts to the responses, it grows while they are fast and
+    it is halved on timeouts and server errors. The batches are requested concurrently on a pool of
+    keep-alive connections, retried with an exponential backoff, and the ones that still fail are
+    reported to the caller instead of being dropped
+    """
+
+    def __init__(self, batchSize=None, minBatchSize=None, maxBatchSize=None, targetSeconds=None, timeout=None, concurrency=None, retries=None, retryDelay=None):
+        self.minBatchSize = max(1, minBatchSize if minBatchSize is not None else config('EGLEM_BATCH_SIZE_MIN', default=50, cast=int))
+        self.maxBatchSize = max(self.minBatchSize, maxBatchSize if maxBatchSize is not None else config('EGLEM_BATCH_SIZE_MAX', default=2000, cast=int))
+        batchSize = batchSize if batchSize is not None else config('EGLEM_BATCH_SIZE', default=200, cast=int)
+        self.batchSize = min(self.maxBatchSize, max(self.minBatchSize, batchSize))
+        # a response slower than targetSeconds shrinks the batch, one faster than half of it grows the batch
+        self.targetSeconds = targetSeconds if targetSeconds is not None else config('EGLEM_BATCH_TARGET_SECONDS', default=5, cast=float)
+        self.timeout = timeout if timeout is not None else config('EGLEM_TIMEOUT', default=60, cast=float)
+        # at most concurrency batches are requested at the same time, by all the callers of the client
+        self.concurrency = max(1, concurrency if concurrency is not None else config('EGLEM_CONCURRENCY', default=4, cast=int))
+        self.retries = retries if retries is not None else config('EGLEM_RETRIES', default=3, cast=int)
+        self.retryDelay = retryDelay if retryDelay is not None else config('EGLEM_RETRY_DELAY', default=1, cast=float)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="eglem")
+        self.lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'ids': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'retries': 0,
+            'failed_batches': 0,
+            'failed_ids': 0,
+            'seconds': 0.0,
+            'grown': 0,
+            'shrunk': 0
+        }
+
+    def getProducts(self, idList):
+        """
+        Retrieve the price and quantity of a list of Eglem products, in concurrent batches of the
+        current size
+
+        Args:
+            idList (list): Eglem ids of the products
+
+        Returns:
+            tuple: The Eglem products found, and the list of the id batches that failed after all
+                the retries, so that the caller can request them again
+        """
+        batches = []
+        position = 0
+        while position < len(idList):
+            batches.append(idList[position:position + self.batchSize])
+            position += len(batches[-1])
+
+        products, failedBatches = [], []
+        futures = [self.executor.submit(self._requestBatchWithRetry, batch) for batch in batches]
+        for batch, future in zip(batches, futures):
+            result = future.result()
+            if result is None:
+                failedBatches.append(batch)
+            else:
+                products.extend(result)
+        return products, failedBatches
+
+    def getStats(self):
+        """
+        Statistics of the requests made so far and the current batch size
+
+        Returns:
+            dict: Requests, ids, errors, timeouts, retries, failed batches, seconds spent and batch
+                size changes
+        """
+        with self.lock:
+            return dict(self.stats, seconds=round(self.stats['seconds'], 3), batch_size=self.batchSize)
+
+    def close(self):
+        """
+        Wait for the pending batches, then release the worker threads and the connections
+        """
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def _requestBatchWithRetry(self, idList):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self.lock:
+                    self.stats['retries'] += 1
+                time.sleep(self.retryDelay * 2 ** (attempt - 1))
+            result, retriable = self._requestBatch(idList)
+            if result is not None or not retriable:
+                break
+        if result is None:
+            logging.error(f"The request of {len(idList)} products to Eglem failed after {attempt + 1} attempts: {idList}")
+            with self.lock:
+                self.stats['failed_batches'] += 1
+                self.stats['failed_ids'] += len(idList)
+        return result
+
+    # a single request of a batch: it returns the products, or None and whether the request is worth retrying
+    def _requestBatch(self, idList):
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                EglemHelper._getHost(),
+                headers=EglemHelper._getHeaders(),
+                data=EglemHelper._getProductsPayload(idList),
+                timeout=self.timeout
+            )
+        except requests.exceptions.Timeout:
+            logging.error(f"The request of {len(idList)} products to Eglem timed out after {self.timeout}s")
+            self._adapt(len(idList), time.perf_counter() - start, timedOut=True)
+            return None, True
+        except Exception as ex:
+            logging.error(f"An exception has been thrown during the retrieval of some products from Eglem: {str(ex)}")
+            self._adapt(len(idList), time.perf_counter() - start, failed=True)
+            return None, True
+
+        seconds = time.perf_counter() - start
+        if response.status_code != 200:
+            logging.error(f"An exception has been thrown: Status code: {response.status_code}, Response: {response.text}")
+            # only the server errors depend on the size of the batch, and only they are worth a retry
+            self._adapt(len(idList), seconds, failed=response.status_code >= 500)
+            return None, response.status_code >= 500
+        self._adapt(len(idList), seconds)
+        try:
+            return response.json()["res"], False
+        except Exception as ex:
+            logging.error(f"An invalid response has been returned by Eglem: {str(ex)}, Response: {response.text}")
+            return None, True
+
+    def _adapt(self, size, seconds, failed=False, timedOut=False):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['ids'] += size
+            self.stats['seconds'] += seconds
+            self.stats['errors'] += 1 if failed or timedOut else 0
+            self.stats['timeouts'] += 1 if timedOut else 0
+
+            batchSize = self.batchSize
+            if failed or timedOut:
+                batchSize = max(self.minBatchSize, batchSize // 2)
+            elif seconds > self.targetSeconds:
+                batchSize = max(self.minBatchSize, int(batchSize * 0.75))
+            elif seconds < self.targetSeconds / 2 and size >= batchSize:
+                # grow only after a full batch, a short one does not say how a bigger one would perform
+                batchSize = min(self.maxBatchSize, int(batchSize * 1.25) + 1)
+
+            if batchSize != self.batchSize:
+                self.stats['grown' if batchSize > self.batchSize else 'shrunk'] += 1
+                logging.debug(f"Eglem batch size changed from {self.batchSize} to {batchSize} after {size} ids in {seconds:.2f}s")
+                self.batchSize = batchSize
@@ -2,16 +2,41 @@
 # then to update them on the basis of the information retrieved from Eglem
 import requests
 import json
-from  decouple import config
+from  decouple import config, Csv
 import logging
 from datetime import datetime, timedelta
 import json
 from lib.helper.SQLHelper import SQLHelper
 import csv
 import pandas as pd
+import math
+import time
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+import re
+import shlex
+import subprocess
 
 class MagentoHelper(SQLHelper):
 
+    # the fields= projections requested by default by the frequent searches, so that Magento returns only the
+    # fields actually read instead of the whole entities (None requests the whole entities)
+    EGLEM_PRODUCTS_FIELDS = "items[sku,price,custom_attributes[attribute_code,value]],total_count"
+    ORDER_FIELDS = "entity_id,increment_id,status,payment[method],items[item_id,sku,product_type,qty_ordered]"
+    SHIPMENTS_FIELDS = "items[entity_id,order_id,track,items[parent_id]],total_count"
+    CREDITMEMOS_FIELDS = "items[entity_id,increment_id,order_id,grand_total,items[sku,price_incl_tax,qty]],total_count"
+    BULK_STATUS_FIELDS = "operations_list[status,serialized_data,result_serialized_data]"
+
+    # the sources whose stock is written by the api and bulk modes, each quantity is sent to all of them
+    @staticmethod
+    def getStockSourceCodes():
+        return config('UPDATE_STOCK_SOURCE_CODES', default=config('SOURCE_CODE_WHEREHOUSE'), cast=Csv())
+
+    # the store ids whose price is written by the api mode, 0 is the global scope
+    @staticmethod
+    def getPriceStoreIds():
+        return config('UPDATE_PRICE_STORE_IDS', default='0', cast=Csv(int))
+
     @staticmethod
     def getConnection():
         return SQLHelper.getConnection(config('MAGENTO_DB_HOST'), config('MAGENTO_DB_PORT', cast=int), config('MAGENTO_DB_DATABASE'), config('MAGENTO_DB_USER'), config('MAGENTO_DB_PASSWORD'))
@@ -39,39 +64,214 @@ class MagentoHelper(SQLHelper):
             "Authorization": f"Bearer {MagentoHelper._getToken(options)}"
         }
 
+    # the session shared by the REST calls, so that the keep-alive connections are reused between the calls
+    _session = requests.Session()
+
+    # a new session, e.g. in a forked process, which must not share the connections of its parent
     @staticmethod
-    def _call(method, urlPath, data=None, options={"externalToken":False,"accessToken":None}):
-        return  requests.request(
+    def resetSession():
+        MagentoHelper._session = requests.Session()
+
+    @staticmethod
+    def _call(method, urlPath, data=None, options={"externalToken":False,"accessToken":None}, fields=None):
+        params = data if method.lower() == 'get' else None
+        if fields:
+            # the fields= projection of the Magento REST API, e.g. items[sku,price],total_count
+            params = dict(params or {}, fields=fields)
+        return  MagentoHelper._session.request(
             method.upper(),
             f"{MagentoHelper._getHost()}{urlPath}",
             headers=MagentoHelper._getHeaders(options),
-            params=data if method.lower() == 'get' else None,
+            params=params,
             json=data if method.lower() != 'get' else None,
         )
 
     # retrieve all the products with an id_eglem associated to, which are visible in
     # catalog and search(visibility=4) and that are active (status=1)
-    def getEglemProducts(currentPage, options={"externalToken":False,"accessToken":None}):
-        data = {}
+    def getEglemProducts(currentPage, options={"externalToken":False,"accessToken":None}, fields=EGLEM_PRODUCTS_FIELDS):
+        data = []
         tot_count = 0
         try:
-            response = MagentoHelper._call(
-                "GET",
-                f"/rest/all/V1/products?searchCriteria[filter_groups][0][filters][0][field]=id_eglem&searchCriteria[filter_groups][0][filters][0][value]=null&searchCriteria[filter_groups][0][filters][0][condition_type]=neq&searchCriteria[filter_groups][1][filters][0][field]=status&searchCriteria[filter_groups][1][filters][0][value]=1&searchCriteria[filter_groups][2][filters][0][field]=type_id&searchCriteria[filter_groups][2][filters][0][value]=simple&searchCriteria[filter_groups][2][filters][0][condition_type]=eq&searchCriteria[pageSize]={config('MAGENTO_GET_PRODUCTS_PAGINATION')}&searchCriteria[currentPage]={currentPage}",
-                None,
-                options
-            )
-            if response.status_code == 200:
-                data = response.json()
-                tot_count = data["total_count"]
+            data, tot_count = MagentoHelper._getEglemProductsPage(currentPage, options, fields)
         except Exception as ex:
             logging.error("An exception has been thrown during the getting of some product: ", str(ex))
 
         finally:
-            if data != {}:
-                return data["items"], tot_count
-            else:
-                return data, tot_count
+            return data, tot_count
+
+    # a single page of the products with an id_eglem, sorted by entity_id so that the page numbers are stable
+    # between two runs. It raises an exception when the request fails
+    @staticmethod
+    def _getEglemProductsPage(currentPage, options={"externalToken":False,"accessToken":None}, fields=EGLEM_PRODUCTS_FIELDS):
+        response = MagentoHelper._call(
+            "GET",
+            f"/rest/all/V1/products?searchCriteria[filter_groups][0][filters][0][field]=id_eglem&searchCriteria[filter_groups][0][filters][0][value]=null&searchCriteria[filter_groups][0][filters][0][condition_type]=neq&searchCriteria[filter_groups][1][filters][0][field]=status&searchCriteria[filter_groups][1][filters][0][value]=1&searchCriteria[filter_groups][2][filters][0][field]=type_id&searchCriteria[filter_groups][2][filters][0][value]=simple&searchCriteria[filter_groups][2][filters][0][condition_type]=eq&searchCriteria[sortOrders][0][field]=entity_id&searchCriteria[sortOrders][0][direction]=ASC&searchCriteria[pageSize]={config('MAGENTO_GET_PRODUCTS_PAGINATION')}&searchCriteria[currentPage]={currentPage}",
+            None,
+            options,
+            fields
+        )
+        if response.status_code != 200:
+            raise Exception(f"Failed to get the products of page {currentPage}. Status Code: {response.status_code}, Response: {response.text}")
+        data = response.json()
+        return data["items"], data["total_count"]
+
+    # a page of the products with an id_eglem, requested again up to `retries` times with an exponential backoff
+    @staticmethod
+    def _getEglemProductsPageWithRetry(currentPage, retries, retryDelay, options={"externalToken":False,"accessToken":None}):
+        attempt = 0
+        while True:
+            try:
+                return MagentoHelper._getEglemProductsPage(currentPage, options)
+            except Exception as ex:
+                if attempt >= retries:
+                    raise
+                logging.warning(f"Retry {attempt + 1}/{retries} of the products page {currentPage}: {str(ex)}")
+                time.sleep(retryDelay * (2 ** attempt))
+                attempt += 1
+
+    # a generator of all the pages of the products with an id_eglem, as couples (currentPage, products).
+    # The first page gives the total count, then the remaining pages are requested concurrently, with at most
+    # `parallelism` requests in flight, and are yielded as soon as they are completed (not in page order)
+    @staticmethod
+    def getEglemProductsStream(parallelism=None, retries=None, retryDelay=None, firstPage=1, options={"externalToken":False,"accessToken":None}):
+        parallelism = parallelism or config('MAGENTO_GET_PRODUCTS_PARALLELISM', default=4, cast=int)
+        retries = retries if retries is not None else config('MAGENTO_GET_PRODUCTS_RETRIES', default=3, cast=int)
+        retryDelay = retryDelay if retryDelay is not None else config('MAGENTO_GET_PRODUCTS_RETRY_DELAY', default=1, cast=float)
+        paginationLimit = config('MAGENTO_GET_PRODUCTS_PAGINATION', cast=int)
+
+        items, totalCount = MagentoHelper._getEglemProductsPageWithRetry(firstPage, retries, retryDelay, options)
+        lastPage = math.ceil(totalCount / paginationLimit) if paginationLimit > 0 else firstPage
+        # Magento returns the last page when the requested one is beyond it
+        if firstPage > lastPage:
+            return
+        yield firstPage, items
+        pages = iter(range(firstPage + 1, lastPage + 1))
+
+        with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+            inFlight = {}
+            for currentPage in itertools.islice(pages, max(1, parallelism)):
+                inFlight[executor.submit(MagentoHelper._getEglemProductsPageWithRetry, currentPage, retries, retryDelay, options)] = currentPage
+            while inFlight:
+                done, _ = wait(inFlight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    currentPage = inFlight.pop(future)
+                    items, _ = future.result()
+                    # keep the number of requests in flight constant, without reading ahead of the consumer
+                    nextPage = next(pages, None)
+                    if nextPage is not None:
+                        inFlight[executor.submit(MagentoHelper._getEglemProductsPageWithRetry, nextPage, retries, retryDelay, options)] = nextPage
+                    yield currentPage, items
+
+    # the same products of getEglemProductsStream() (active simple products with an id_eglem), read straight from
+    # the Magento database one page at a time, as couples (currentPage, products). Each product is a dictionary
+    # with entity_id, sku, id_eglem, price (global scope) and quantity (source SOURCE_CODE_WHEREHOUSE).
+    # The rows are ordered by entity_id, so that the page numbers are stable between two runs. With a shard
+    # (index, count) only the products with CRC32(id_eglem) % count == index are read, with hotProducts (see
+    # _getHotProductsQuery) only the hot products of the fast lane are read
+    @staticmethod
+    def getEglemProductsDatabase(pageSize=None, firstPage=1, shard=None, hotProducts=None, options={"connection":None, "close":True}):
+        pageSize = pageSize or config('MAGENTO_DB_GET_PRODUCTS_PAGINATION', default=500, cast=int)
+        try:
+            connection = options["connection"] if options["connection"] else MagentoHelper.getConnection()
+            cursor = connection.cursor(dictionary=True, buffered=True)
+            # the value table of id_eglem depends on the backend type of the attribute
+            cursor.execute("""
+                SELECT ea.backend_type
+                FROM eav_attribute ea
+                INNER JOIN eav_entity_type eet ON eet.entity_type_id = ea.entity_type_id AND eet.entity_type_code = 'catalog_product'
+                WHERE ea.attribute_code = 'id_eglem'
+            """)
+            attribute = cursor.fetchone()
+            if not attribute or attribute["backend_type"] not in ('int', 'varchar', 'text', 'decimal'):
+                raise Exception(f"Unexpected backend type of the attribute id_eglem: {attribute}")
+
+            fromClause = f"""
+                FROM catalog_product_entity cpe
+                INNER JOIN eav_entity_type eet ON eet.entity_type_code = 'catalog_product'
+                INNER JOIN eav_attribute ea_eglem ON ea_eglem.entity_type_id = eet.entity_type_id AND ea_eglem.attribute_code = 'id_eglem'
+                INNER JOIN catalog_product_entity_{attribute["backend_type"]} eglem ON eglem.entity_id = cpe.entity_id AND eglem.attribute_id = ea_eglem.attribute_id AND eglem.store_id = 0
+                INNER JOIN eav_attribute ea_status ON ea_status.entity_type_id = eet.entity_type_id AND ea_status.attribute_code = 'status'
+                INNER JOIN catalog_product_entity_int status ON status.entity_id = cpe.entity_id AND status.attribute_id = ea_status.attribute_id AND status.store_id = 0
+                INNER JOIN eav_attribute ea_price ON ea_price.entity_type_id = eet.entity_type_id AND ea_price.attribute_code = 'price'
+                LEFT JOIN catalog_product_entity_decimal price ON price.entity_id = cpe.entity_id AND price.attribute_id = ea_price.attribute_id AND price.store_id = 0
+                LEFT JOIN inventory_source_item isi ON isi.sku = cpe.sku AND isi.source_code = %s
+                {f"INNER JOIN ({MagentoHelper._getHotProductsQuery(hotProducts['bestsellers_category_id'])}) hot ON hot.entity_id = cpe.entity_id" if hotProducts else ""}
+                WHERE
+                    cpe.type_id = 'simple'
+                    AND status.value = 1
+                    AND eglem.value IS NOT NULL
+                    {"AND MOD(CRC32(eglem.value), %s) = %s" if shard else ""}
+                    AND cpe.entity_id > %s
+                ORDER BY cpe.entity_id
+            """
+            params = (config("SOURCE_CODE_WHEREHOUSE"),)
+            if hotProducts:
+                params += (
+                    config("SOURCE_CODE_WHEREHOUSE"),
+                    hotProducts["low_stock"],
+                    hotProducts["recent_minutes"]
+                )
+                if hotProducts["bestsellers_category_id"]:
+                    params += (hotProducts["bestsellers_category_id"],)
+            if shard:
+                params += (shard[1], shard[0])
+
+            # keyset paging: every page is a short query of the products after the last entity_id of the previous
+            # one, so that no cursor stays open while the pipeline is busy. A resumed run starts after the last
+            # entity_id of the page before firstPage, found with a single query on the entity_id only
+            lastEntityId = 0
+            if firstPage > 1:
+                cursor.execute(f"SELECT cpe.entity_id {fromClause} LIMIT 1 OFFSET %s", params + (lastEntityId, (firstPage - 1) * pageSize - 1))
+                row = cursor.fetchone()
+                if not row:
+                    return
+                lastEntityId = row["entity_id"]
+
+            query = f"SELECT cpe.entity_id, cpe.sku, eglem.value AS id_eglem, price.value AS price, isi.quantity {fromClause} LIMIT %s"
+            currentPage = firstPage
+            while True:
+                cursor.execute(query, params + (lastEntityId, pageSize))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                lastEntityId = rows[-1]["entity_id"]
+                yield currentPage, rows
+                if len(rows) < pageSize:
+                    break
+                currentPage += 1
+
+        except Exception as ex:
+            raise Exception(f"Error on get products from database: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                MagentoHelper.connectionClose(connection)
+
+    # the entity_id of the hot products synced by the fast lane: the ones still in stock with a quantity up to low_stock
+    # on the source SOURCE_CODE_WHEREHOUSE, the ones ordered in the last recent_minutes minutes (read through the
+    # index on sales_order.created_at) and, when bestsellers_category_id is set, the bestsellers already selected by
+    # the be_pr_update_bestsellers procedure into that category. Its parameters follow this order
+    @staticmethod
+    def _getHotProductsQuery(bestsellersCategoryId=None):
+        query = """
+            SELECT cpe_low.entity_id
+            FROM inventory_source_item isi_low
+            INNER JOIN catalog_product_entity cpe_low ON cpe_low.sku = isi_low.sku
+            WHERE isi_low.source_code = %s AND isi_low.quantity > 0 AND isi_low.quantity <= %s
+            UNION
+            SELECT soi_recent.product_id
+            FROM sales_order so_recent
+            INNER JOIN sales_order_item soi_recent ON soi_recent.order_id = so_recent.entity_id
+            WHERE so_recent.created_at >= UTC_TIMESTAMP() - INTERVAL %s MINUTE
+        """
+        if bestsellersCategoryId:
+            query += """
+            UNION
+            SELECT ccp_best.product_id
+            FROM catalog_category_product ccp_best
+            WHERE ccp_best.category_id = %s
+            """
+        return query
 
     # This rule updates the quantity and price in one single call
     def setPriceProduct(skuProduct, price, options={"externalToken":False,"accessToken":None}):
@@ -101,7 +301,7 @@ class MagentoHelper(SQLHelper):
         finally:
             return updateStatus
 
-    def setStockProduct(skuProduct, quantity, options={"externalToken":False,"accessToken":None}):
+    def setStockProduct(skuProduct, quantity, options={"externalToken":False,"accessToken":None}, sourceCodes=None):
         updateStatus = ""
         try:
             response = MagentoHelper._call(
@@ -111,10 +311,11 @@ class MagentoHelper(SQLHelper):
                     "sourceItems": [
                         {
                             "sku": skuProduct,
-                            "source_code": config("SOURCE_CODE_WHEREHOUSE"),
+                            "source_code": sourceCode,
                             "quantity": quantity,
                             "status": 0 if quantity == 0 else 1
                         }
+                        for sourceCode in sourceCodes or MagentoHelper.getStockSourceCodes()
                     ]
                 },
                 options
@@ -133,46 +334,357 @@ class MagentoHelper(SQLHelper):
         finally:
             return updateStatus
 
-    def setStockProductDatabase(productToUpdateTupla, websiteCode, statusOrderForExludeQty, methodPaymentForExludeQty, options={"connection":None, "close":True}):
+    # load a list of (sku, value) couples into a session temporary table, with chunked parameterized multi-row inserts,
+    # so that the update queries can join against it instead of embedding the values into the SQL
+    @staticmethod
+    def _loadStagingTable(cursor, tableName, rows, chunkSize=None):
+        chunkSize = chunkSize or config('MAGENTO_DB_STAGING_CHUNK_SIZE', default=1000, cast=int)
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {tableName}")
+        cursor.execute(f"CREATE TEMPORARY TABLE {tableName} (sku varchar(64) NOT NULL, value decimal(20,6), PRIMARY KEY (sku))")
+        insertQuery = f"INSERT INTO {tableName} (sku, value) VALUES (%s, %s) ON DUPLICATE KEY UPDATE value=VALUES(value)"
+        for index in range(0, len(rows), chunkSize):
+            cursor.executemany(insertQuery, rows[index:index + chunkSize])
+
+    @staticmethod
+    def _dropStagingTable(cursor, tableName):
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {tableName}")
+
+    # batched version of setPriceProduct: the prices of a list of items ({sku, price}) are sent to the base-prices
+    # endpoint, `batchSize` skus for each call, on each of the storeIds (UPDATE_PRICE_STORE_IDS, the global scope by
+    # default). It returns a dictionary sku -> update status, the skus reported by Magento within the errors of a call are set to 'e'
+    def setPriceProducts(itemList, batchSize=None, options={"externalToken":False,"accessToken":None}, storeIds=None):
+        batchSize = batchSize or config('MAGENTO_API_BATCH_SIZE', default=500, cast=int)
+        storeIds = storeIds or MagentoHelper.getPriceStoreIds()
+        updateStatusMap = {}
+        for index in range(0, len(itemList), batchSize):
+            batch = itemList[index:index + batchSize]
+            skuList = [item["sku"] for item in batch]
+            try:
+                response = MagentoHelper._call(
+                    "POST",
+                    "/rest/all/V1/products/base-prices",
+                    {
+                        "prices": [
+                            {"sku": item["sku"], "price": item["price"], "store_id": storeId}
+                            for item in batch
+                            for storeId in storeIds
+                        ]
+                    },
+                    options
+                )
+
+                if response.status_code == 200:
+                    updateStatusMap.update({sku: 'c' for sku in skuList})
+                    # the skus that Magento could not update are listed within the parameters of the errors
+                    for error in response.json() or []:
+                        parameters = error.get("parameters") or {}
+                        values = parameters.values() if isinstance(parameters, dict) else parameters
+                        for value in values:
+                            if value in updateStatusMap:
+                                updateStatusMap[value] = 'e'
+                                logging.error(f"Failed to update the price of product {value}: {error.get('message')}")
+                else:
+                    updateStatusMap.update({sku: 'e' for sku in skuList})
+                    logging.error(f"Failed to update the price of {len(skuList)} products. Status Code: {response.status_code}, Response: {response.text}")
+
+            except Exception as ex:
+                logging.error(f"An exception has been thrown while updating Magento products: {str(ex)}")
+                updateStatusMap.update({sku: 'e' for sku in skuList})
+
+        return updateStatusMap
+
+    # batched version of setStockProduct: the quantities of a list of items ({sku, quantity}) are sent as one
+    # sourceItems array, `batchSize` skus for each call, with one source item for each of the sourceCodes. Magento
+    # rejects a whole call when one item is invalid, so a failed call is repeated one sku at a time.
+    # It returns a dictionary sku -> update status
+    def setStockProducts(itemList, batchSize=None, options={"externalToken":False,"accessToken":None}, sourceCodes=None):
+        batchSize = batchSize or config('MAGENTO_API_BATCH_SIZE', default=500, cast=int)
+        sourceCodes = sourceCodes or MagentoHelper.getStockSourceCodes()
+        updateStatusMap = {}
+        for index in range(0, len(itemList), batchSize):
+            batch = itemList[index:index + batchSize]
+            try:
+                response = MagentoHelper._call(
+                    "POST",
+                    "/rest/V1/inventory/source-items",
+                    {
+                        "sourceItems": [
+                            {
+                                "sku": item["sku"],
+                                "source_code": sourceCode,
+                                "quantity": item["quantity"],
+                                "status": 0 if item["quantity"] == 0 else 1
+                            }
+                            for item in batch
+                            for sourceCode in sourceCodes
+                        ]
+                    },
+                    options
+                )
+
+                if response.status_code == 200:
+                    updateStatusMap.update({item["sku"]: 'c' for item in batch})
+                    continue
+                logging.error(f"Failed to update the stock of {len(batch)} products. Status Code: {response.status_code}, Response: {response.text}")
+
+            except Exception as ex:
+                logging.error(f"An exception has been thrown while updating Magento products: {str(ex)}")
+
+            if len(batch) == 1:
+                updateStatusMap[batch[0]["sku"]] = 'e'
+            else:
+                for item in batch:
+                    updateStatusMap[item["sku"]] = MagentoHelper.setStockProduct(item["sku"], item["quantity"], options, sourceCodes)
+
+        return updateStatusMap
+
+    # the tables of the quantity reserved by the orders, maintained by refreshReservedQuantity: the reserved quantity of
+    # each (sku, website), the contribution of each order to it and the filter and last order update already applied
+    @staticmethod
+    def _createReservedQuantityTables(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS eglem_reserved_quantity (
+                sku varchar(64) NOT NULL,
+                website_code varchar(32) NOT NULL,
+                reserved_qty decimal(12,4) NOT NULL DEFAULT 0,
+                PRIMARY KEY (sku, website_code)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS eglem_reserved_order_item (
+                order_id int unsigned NOT NULL,
+                sku varchar(64) NOT NULL,
+                website_code varchar(32) NOT NULL,
+                qty decimal(12,4) NOT NULL,
+                PRIMARY KEY (order_id, sku, website_code)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS eglem_reserved_quantity_state (
+                id tinyint unsigned NOT NULL,
+                filter varchar(1024) NOT NULL,
+                updated_at timestamp NULL DEFAULT NULL,
+                PRIMARY KEY (id)
+            )
+        """)
+
+    # bring eglem_reserved_quantity up to date with the orders updated since the last refresh: the contribution of each
+    # of these orders is recomputed (zero when the order has left the given status and payment methods) and only the
+    # difference with the previous one is applied, so that the sales tables are read through the index on updated_at
+    # instead of being scanned. The tables are rebuilt from the orders in the given statuses when the filter changes
+    # or when rebuild is set. It returns the number of orders recomputed
+    def refreshReservedQuantity(statusOrderForExludeQty, methodPaymentForExludeQty, rebuild=False, options={"connection":None, "close":True}):
+        ordersRefreshed = 0
+        connection = None
+        locked = False
+        try:
+            connection = options["connection"] if options["connection"] else MagentoHelper.getConnection()
+            cursor = connection.cursor()
+            status = statusOrderForExludeQty.split(',')
+            methodPayment = methodPaymentForExludeQty.split(',')
+            orderFilter = f"{','.join(status)}|{','.join(methodPayment)}"
+            MagentoHelper._createReservedQuantityTables(cursor)
+
+            # the concurrent writers (shards, website groups) refresh one at a time, the others find it up to date
+            cursor.execute("SELECT GET_LOCK('eglem_reserved_quantity', %s)", (config('RESERVED_QUANTITY_LOCK_SECONDS', default=60, cast=int),))
+            locked = cursor.fetchone()[0] == 1
+            if not locked:
+                raise Exception("Timeout on the lock of the reserved quantity")
+
+            cursor.execute("SELECT filter, updated_at FROM eglem_reserved_quantity_state WHERE id = 1")
+            state = cursor.fetchone()
+            if rebuild or not state or state[0] != orderFilter or state[1] is None:
+                cursor.execute("DELETE FROM eglem_reserved_order_item")
+                cursor.execute("DELETE FROM eglem_reserved_quantity")
+                lastUpdatedAt = None
+            else:
+                lastUpdatedAt = state[1]
+            cursor.execute("SELECT MAX(updated_at) FROM sales_order")
+            maxUpdatedAt = cursor.fetchone()[0]
+
+            # the orders to recompute: on a rebuild the ones in the given statuses, otherwise the ones updated since the
+            # last refresh, with an overlap for the transactions committed after it with an older updated_at
+            MagentoHelper._dropStagingTable(cursor, "tmp_reserved_orders")
+            cursor.execute("CREATE TEMPORARY TABLE tmp_reserved_orders (order_id int unsigned NOT NULL, PRIMARY KEY (order_id))")
+            if lastUpdatedAt is None:
+                cursor.execute(f"""
+                    INSERT INTO tmp_reserved_orders (order_id)
+                        SELECT so.entity_id FROM sales_order so WHERE so.status IN ({", ".join(["%s"] * len(status))})
+                """, tuple(status))
+            else:
+                cursor.execute("""
+                    INSERT INTO tmp_reserved_orders (order_id)
+                        SELECT so.entity_id FROM sales_order so WHERE so.updated_at >= %s - INTERVAL %s MINUTE
+                """, (lastUpdatedAt, config('RESERVED_QUANTITY_OVERLAP_MINUTES', default=5, cast=int)))
+            ordersRefreshed = cursor.rowcount
+
+            if ordersRefreshed:
+                # the current contribution of each order, the same filter of the reserved quantity of the stock update
+                MagentoHelper._dropStagingTable(cursor, "tmp_reserved_new")
+                cursor.execute(f"""
+                    CREATE TEMPORARY TABLE tmp_reserved_new AS
+                        SELECT so.entity_id AS order_id, cpe.sku, sw.code AS website_code, SUM(soi.qty_ordered) AS qty
+                        FROM tmp_reserved_orders tro
+                        INNER JOIN sales_order so ON so.entity_id = tro.order_id
+                        INNER JOIN store s ON s.store_id = so.store_id
+                        INNER JOIN store_website sw ON sw.website_id = s.website_id
+                        INNER JOIN sales_order_item soi ON so.entity_id = soi.order_id
+                        INNER JOIN catalog_product_entity cpe ON cpe.entity_id = soi.product_id
+                        INNER JOIN sales_order_payment sop ON sop.parent_id = so.entity_id
+                        WHERE
+                            so.status IN ({", ".join(["%s"] * len(status))})
+                            AND sop.`method` IN ({", ".join(["%s"] * len(methodPayment))})
+                        GROUP BY so.entity_id, cpe.sku, sw.code
+                """, (*status, *methodPayment))
+
+                # the difference between the current and the previous contributions of the orders
+                MagentoHelper._dropStagingTable(cursor, "tmp_reserved_delta")
+                cursor.execute("""
+                    CREATE TEMPORARY TABLE tmp_reserved_delta AS
+                        SELECT delta.sku, delta.website_code, SUM(delta.qty) AS qty
+                        FROM (
+                            SELECT trn.sku, trn.website_code, trn.qty FROM tmp_reserved_new trn
+                            UNION ALL
+                            SELECT roi.sku, roi.website_code, -roi.qty
+                            FROM eglem_reserved_order_item roi
+                            INNER JOIN tmp_reserved_orders tro ON tro.order_id = roi.order_id
+                        ) delta
+                        GROUP BY delta.sku, delta.website_code
+                        HAVING SUM(delta.qty) <> 0
+                """)
+                cursor.execute("""
+                    INSERT INTO eglem_reserved_quantity (sku, website_code, reserved_qty)
+                        SELECT trd.sku, trd.website_code, trd.qty FROM tmp_reserved_delta trd
+                    ON DUPLICATE KEY UPDATE
+                        reserved_qty = reserved_qty + VALUES(reserved_qty)
+                """)
+                cursor.execute("""
+                    DELETE erq FROM eglem_reserved_quantity erq
+                    INNER JOIN tmp_reserved_delta trd ON trd.sku = erq.sku AND trd.website_code = erq.website_code
+                    WHERE erq.reserved_qty <= 0
+                """)
+                cursor.execute("""
+                    DELETE roi FROM eglem_reserved_order_item roi
+                    INNER JOIN tmp_reserved_orders tro ON tro.order_id = roi.order_id
+                """)
+                cursor.execute("""
+                    INSERT INTO eglem_reserved_order_item (order_id, sku, website_code, qty)
+                        SELECT trn.order_id, trn.sku, trn.website_code, trn.qty FROM tmp_reserved_new trn
+                """)
+                MagentoHelper._dropStagingTable(cursor, "tmp_reserved_delta")
+                MagentoHelper._dropStagingTable(cursor, "tmp_reserved_new")
+
+            cursor.execute("""
+                INSERT INTO eglem_reserved_quantity_state (id, filter, updated_at) VALUES (1, %s, %s)
+                ON DUPLICATE KEY UPDATE filter=VALUES(filter), updated_at=VALUES(updated_at)
+            """, (orderFilter, maxUpdatedAt))
+            MagentoHelper._dropStagingTable(cursor, "tmp_reserved_orders")
+            connection.commit()
+
+        except Exception as ex:
+            if connection:
+                connection.rollback()
+            raise Exception(f"Error on refresh of the reserved quantity: {str(ex)}")
+
+        finally:
+            if connection and locked:
+                cursor = connection.cursor()
+                cursor.execute("SELECT RELEASE_LOCK('eglem_reserved_quantity')")
+                cursor.fetchall()
+            if options["close"]:
+                MagentoHelper.connectionClose(connection)
+        return ordersRefreshed
+
+    # the quantity reserved on a source for each sku: the sum of the reservations of the websites of a list whose stock
+    # is linked to the source, the same quantity subtracted by setStockProductDatabase. It returns a list of (sku, reserved_qty)
+    def getReservedQuantities(websiteCodes, sourceCode, options={"connection":None, "close":True}):
+        reserved = []
+        try:
+            connection = options["connection"] if options["connection"] else MagentoHelper.getConnection()
+            cursor = connection.cursor()
+            cursor.execute(f"""
+                SELECT erq.sku, SUM(erq.reserved_qty)
+                FROM eglem_reserved_quantity erq
+                INNER JOIN (
+                    SELECT DISTINCT issc.code AS website_code
+                    FROM inventory_stock_sales_channel issc
+                    INNER JOIN inventory_source_stock_link issl ON issl.stock_id = issc.stock_id
+                    WHERE issc.type = 'website' AND issl.source_code = %s AND issc.code IN ({", ".join(["%s"] * len(websiteCodes))})
+                ) website_source ON website_source.website_code = erq.website_code
+                GROUP BY erq.sku
+            """, (sourceCode, *websiteCodes))
+            reserved = cursor.fetchall()
+
+        except Exception as ex:
+            raise Exception(f"Error on get the reserved quantities: {str(ex)}")
+
+        finally:
+            if options["close"]:
+                MagentoHelper.connectionClose(connection)
+        return reserved
+
+    # update the stock of a list of (sku, quantity) couples for a website (or for a list of websites), the quantity reserved
+    # by the orders with the given status and payment methods is subtracted from the Eglem quantity: it is read from
+    # eglem_reserved_quantity, refreshed first with the orders updated since the last write. A source item shared by
+    # several websites of the list is written once, net of the reservations of all of them. Only the source items whose
+    # quantity or status actually changes are written, the method returns their number and the entity_id of their products
+    def setStockProductDatabase(productToUpdateList, websiteCode, statusOrderForExludeQty, methodPaymentForExludeQty, options={"connection":None, "close":True}):
+        rowsModified, entityIds = 0, []
+        websiteCodes = list(websiteCode) if isinstance(websiteCode, (list, tuple)) else [websiteCode]
         try:
             connection = options["connection"] if options["connection"] else MagentoHelper.getConnection()
+            MagentoHelper.refreshReservedQuantity(statusOrderForExludeQty, methodPaymentForExludeQty, options={"connection": connection, "close": False})
             cursor = connection.cursor()
-            status = statusOrderForExludeQty.replace(',', "','")
-            methodPayment = methodPaymentForExludeQty.replace(',', "','")
+            MagentoHelper._loadStagingTable(cursor, "tmp_stock_update", productToUpdateList)
 
+            # the new quantity and status of each source item, compared with the current ones
+            MagentoHelper._dropStagingTable(cursor, "tmp_stock_changes")
             query = f"""
-            INSERT INTO inventory_source_item(source_code, sku, quantity, status)
-                SELECT
-                    issl.source_code, source_stock.sku,
-                    CASE WHEN reserved.qty IS NOT NULL
-                        THEN IF(source_stock.stock>reserved.qty, source_stock.stock-reserved.qty, 0)
-                        ELSE source_stock.stock
-                    END as stock,
-                    IF(IF(reserved.qty, source_stock.stock-reserved.qty, source_stock.stock)>0, 1, 0) AS status
-                FROM inventory_stock_sales_channel issc
-                INNER JOIN inventory_source_stock_link issl ON issl.stock_id = issc.stock_id AND issc.type = 'website' AND issc.code = %s,
-                (SELECT *
-                FROM (SELECT NULL AS sku, NULL AS stock) tmp
-                WHERE tmp.sku IS NOT NULL
-                UNION VALUES {productToUpdateTupla}) source_stock
-                LEFT JOIN (
-                    SELECT cpe.entity_id, cpe.sku, SUM(soi.qty_ordered) as qty
-                    FROM sales_order so
-                    INNER JOIN store s ON s.store_id = so.store_id
-                    INNER JOIN store_website sw ON sw.website_id = s.website_id AND sw.code = %s
-                    INNER JOIN sales_order_item soi ON so.entity_id = soi.order_id
-                    INNER JOIN catalog_product_entity cpe ON cpe.entity_id = soi.product_id
-                    INNER JOIN sales_order_payment sop ON sop.parent_id = so.entity_id
-                    WHERE
-                        so.status IN ('{status}')
-                        AND sop.`method` IN ('{methodPayment}')
-                    GROUP BY cpe.entity_id, cpe.sku
-                ) reserved ON reserved.sku = source_stock.sku
-            ON DUPLICATE KEY UPDATE
-                    quantity=VALUES(quantity),
-                    status=VALUES(status)
+            CREATE TEMPORARY TABLE tmp_stock_changes AS
+                SELECT new_stock.source_code, new_stock.sku, new_stock.stock AS quantity, new_stock.status
+                FROM (
+                    SELECT
+                        website_source.source_code, tsu.sku,
+                        GREATEST(tsu.value - COALESCE(SUM(erq.reserved_qty), 0), 0) AS stock,
+                        IF(tsu.value - COALESCE(SUM(erq.reserved_qty), 0) > 0, 1, 0) AS status
+                    FROM tmp_stock_update tsu
+                    CROSS JOIN (
+                        SELECT DISTINCT issc.code AS website_code, issl.source_code
+                        FROM inventory_stock_sales_channel issc
+                        INNER JOIN inventory_source_stock_link issl ON issl.stock_id = issc.stock_id
+                        WHERE issc.type = 'website' AND issc.code IN ({", ".join(["%s"] * len(websiteCodes))})
+                    ) website_source
+                    LEFT JOIN eglem_reserved_quantity erq ON erq.sku = tsu.sku AND erq.website_code = website_source.website_code
+                    GROUP BY website_source.source_code, tsu.sku, tsu.value
+                ) new_stock
+                LEFT JOIN inventory_source_item isi ON isi.source_code = new_stock.source_code AND isi.sku = new_stock.sku
+                WHERE
+                    isi.source_item_id IS NULL
+                    OR isi.quantity <> new_stock.stock
+                    OR isi.status <> new_stock.status
             """
-            cursor.execute(query, (websiteCode, websiteCode))
+            cursor.execute(query, tuple(websiteCodes))
+            cursor.execute("SELECT COUNT(*) FROM tmp_stock_changes")
+            rowsModified = cursor.fetchone()[0]
+
+            if rowsModified:
+                cursor.execute("""
+                    SELECT DISTINCT cpe.entity_id
+                    FROM tmp_stock_changes tsc
+                    INNER JOIN catalog_product_entity cpe ON cpe.sku = tsc.sku
+                """)
+                entityIds = [row[0] for row in cursor.fetchall()]
+                cursor.execute("""
+                    INSERT INTO inventory_source_item(source_code, sku, quantity, status)
+                        SELECT tsc.source_code, tsc.sku, tsc.quantity, tsc.status
+                        FROM tmp_stock_changes tsc
+                    ON DUPLICATE KEY UPDATE
+                        quantity=VALUES(quantity),
+                        status=VALUES(status)
+                """)
+                MagentoHelper._insertReindexChangelogs(cursor, 'stock', entityIds)
+            MagentoHelper._dropStagingTable(cursor, "tmp_stock_changes")
+            MagentoHelper._dropStagingTable(cursor, "tmp_stock_update")
             connection.commit()
 
         except Exception as ex:
@@ -181,160 +693,264 @@ class MagentoHelper(SQLHelper):
         finally:
             if options["close"]:
                 MagentoHelper.connectionClose(connection)
-            return
-
-    def setPriceProductDatabase(productToUpdateTupla, websiteCode, websiteCodeGlobal, options={"connection":None, "close":True}):
+        return rowsModified, entityIds
+
+    # update the price of a list of (sku, price) couples on the global store, for the products of a website (or of
+    # any website of a list). Only the rows whose stored value actually changes are written, the method returns
+    # their number and their entity_id
+    def setPriceProductDatabase(productToUpdateList, websiteCode, websiteCodeGlobal, options={"connection":None, "close":True}):
+        rowsModified, entityIds = 0, []
+        websiteCodes = list(websiteCode) if isinstance(websiteCode, (list, tuple)) else [websiteCode]
         try:
             connection = options["connection"] if options["connection"] else MagentoHelper.getConnection()
             cursor = connection.cursor()
+            MagentoHelper._loadStagingTable(cursor, "tmp_price_update", productToUpdateList)
+
+            # the new price rows, compared with the values currently stored
+            MagentoHelper._dropStagingTable(cursor, "tmp_price_changes")
             query = f"""
-                INSERT INTO catalog_product_entity_decimal(attribute_id, store_id, entity_id, value)
-                    SELECT attr.attribute_id, global_store.store_id, cpe.entity_id, price.value
-                    FROM (
-                        SELECT *
-                        FROM (SELECT NULL AS sku, NULL AS value) tmp
-                        WHERE tmp.sku IS NOT NULL
-                        UNION VALUES {productToUpdateTupla}
-                    ) price
+                CREATE TEMPORARY TABLE tmp_price_changes AS
+                    SELECT DISTINCT attr.attribute_id, global_store.store_id, cpe.entity_id, price.value
+                    FROM tmp_price_update price
                     INNER JOIN catalog_product_entity cpe ON cpe.sku = price.sku
                     INNER JOIN catalog_product_website cpw ON cpe.entity_id = cpw.product_id
-                    INNER JOIN store_website sw ON sw.website_id = cpw.website_id AND sw.code = %s
-                    INNER JOIN store s ON s.website_id = cpw.website_id,
-                    (
-                        select s.store_id
-                        FROM store_website sw
-                        INNER JOIN store s ON s.website_id = sw.website_id AND sw.code = %s
-                    ) global_store,
-                    (SELECT ea.attribute_id, ea.attribute_code, ea.backend_type
-                            FROM eav_attribute ea
-                            LEFT JOIN eav_entity_type eet ON eet.entity_type_id = ea.entity_type_id
-                            WHERE ea.attribute_code = 'price') attr
-                    ON DUPLICATE KEY UPDATE value=VALUES(value)
+                    INNER JOIN store_website sw ON sw.website_id = cpw.website_id AND sw.code IN ({", ".join(["%s"] * len(websiteCodes))})
+                    INNER JOIN store_website global_website ON global_website.code = %s
+                    INNER JOIN store global_store ON global_store.website_id = global_website.website_id
+                    INNER JOIN eav_attribute attr ON attr.attribute_code = 'price'
+                    INNER JOIN eav_entity_type eet ON eet.entity_type_id = attr.entity_type_id AND eet.entity_type_code = 'catalog_product'
+                    LEFT JOIN catalog_product_entity_decimal cped
+                        ON cped.attribute_id = attr.attribute_id
+                        AND cped.store_id = global_store.store_id
+                        AND cped.entity_id = cpe.entity_id
+                    WHERE
+                        cped.value_id IS NULL
+                        OR cped.value IS NULL
+                        OR cped.value <> price.value
             """
-            cursor.execute(query, (websiteCode, websiteCodeGlobal))
+            cursor.execute(query, (*websiteCodes, websiteCodeGlobal))
+            cursor.execute("SELECT COUNT(*) FROM tmp_price_changes")
+            rowsModified = cursor.fetchone()[0]
+
+            if rowsModified:
+                cursor.execute("SELECT DISTINCT tpc.entity_id FROM tmp_price_changes tpc")
+                entityIds = [row[0] for row in cursor.fetchall()]
+                cursor.execute("""
+                    INSERT INTO catalog_product_entity_decimal(attribute_id, store_id, entity_id, value)
+                        SELECT tpc.attribute_id, tpc.store_id, tpc.entity_id, tpc.value
+                        FROM tmp_price_changes tpc
+                    ON DUPLICATE KEY UPDATE value=VALUES(value)
+                """)
+                # the changelog rows are committed with the prices, so that a written price is never left unindexed
+                MagentoHelper._insertReindexChangelogs(cursor, 'price', entityIds)
+            MagentoHelper._dropStagingTable(cursor, "tmp_price_changes")
+            MagentoHelper._dropStagingTable(cursor, "tmp_price_update")
             connection.commit()
 
         except Exception as ex:
-            raise Exception(f"Error on update stock: {str(ex)}")
+            raise Exception(f"Error on update price: {str(ex)}")
 
         finally:
             if options["close"]:
                 MagentoHelper.connectionClose(connection)
-            return
+        return rowsModified, entityIds
 
-    # This rule bulk updates the quantity and price of a list of products
-    def setPriceProductBulk(itemList, options={"externalToken":False,"accessToken":None}):
-        data = {}
-        updateStatus = ""
+    # group a list of websites by the sources of their stocks: the websites of different groups write different
+    # source items, so their stock can be updated concurrently, while the ones of the same group are written together
+    @staticmethod
+    def getStockWebsiteGroups(websiteCodes, options={"connection":None, "close":True}):
+        groups = []
         try:
-            itemIdEglem = None # dummy variable, only used to update product_history db table
-            itemSku = None
-            itemPrice = None
-            dataList = []
+            connection = options["connection"] if options["connection"] else MagentoHelper.getConnection()
+            cursor = connection.cursor()
+            cursor.execute(f"""
+                SELECT issc.code, issl.source_code
+                FROM inventory_stock_sales_channel issc
+                INNER JOIN inventory_source_stock_link issl ON issl.stock_id = issc.stock_id
+                WHERE issc.type = 'website' AND issc.code IN ({", ".join(["%s"] * len(websiteCodes))})
+            """, tuple(websiteCodes))
+            sources = {websiteCode: set() for websiteCode in websiteCodes}
+            for websiteCode, sourceCode in cursor.fetchall():
+                sources[websiteCode].add(sourceCode)
+
+            # merge the websites that share at least one source
+            for websiteCode in websiteCodes:
+                group = {"websites": [websiteCode], "sources": set(sources[websiteCode])}
+                for other in [other for other in groups if other["sources"] & group["sources"]]:
+                    groups.remove(other)
+                    group["websites"] = other["websites"] + group["websites"]
+                    group["sources"] |= other["sources"]
+                groups.append(group)
 
-            for item in itemList:
-                itemIdEglem = item["id_eglem"] # dummy variable, only used to update product_history db table
-                itemSku = item["sku"]
-                itemPrice = item["price"]
+        except Exception as ex:
+            raise Exception(f"Error on get the stock sources of the websites: {str(ex)}")
 
-                dataList.append({
-                    "product": {
-                        "sku": itemSku,
-                        "price": itemPrice
-                    }
-                })
+        finally:
+            if options["close"]:
+                MagentoHelper.connectionClose(connection)
+        return [group["websites"] for group in groups]
+
+    # tell Magento which products have been changed by the database mode, so that the next scheduled indexer run
+    # processes only them. With MAGENTO_REINDEX_MODE=changelog the entity_id are inserted into the mview changelog
+    # tables of the indexer (MAGENTO_REINDEX_PRICE_CHANGELOGS / MAGENTO_REINDEX_STOCK_CHANGELOGS), with
+    # MAGENTO_REINDEX_MODE=command the MAGENTO_REINDEX_COMMAND is executed with the indexer as last argument
+    # and the entity_id on the standard input, one per line. The database writers already insert their changelog rows
+    # within their own transaction
+    @staticmethod
+    def notifyReindex(indexer, entityIds, options={"connection":None, "close":True}):
+        mode = config('MAGENTO_REINDEX_MODE', default='changelog')
+        if not entityIds or mode == 'none':
+            return
 
-            response = MagentoHelper._call(
-                "PUT",
-                "/rest/all/async/bulk/V1/products",
-                dataList,
-                options
+        if mode == 'command':
+            subprocess.run(
+                shlex.split(config('MAGENTO_REINDEX_COMMAND')) + [indexer],
+                input="\n".join([str(entityId) for entityId in entityIds]),
+                text=True,
+                check=True
             )
+            return
+
+        try:
+            connection = options["connection"] if options["connection"] else MagentoHelper.getConnection()
+            MagentoHelper._insertReindexChangelogs(connection.cursor(), indexer, entityIds)
+            connection.commit()
 
-            # the response return the uuid associated to the Cron's job that processes the queue
-            data = response.json()
         except Exception as ex:
-            logging.error("An exception has been thrown during a bulk update of some Magento products", str(ex))
+            raise Exception(f"Error on notify the {indexer} reindex: {str(ex)}")
 
         finally:
-            if data:
-                updateStatus = 'p'
-                return data["bulk_uuid"], updateStatus
-            else:
-                raise Exception
+            if options["close"]:
+                MagentoHelper.connectionClose(connection)
 
-    def setStockProductBulk(itemList, options={"externalToken":False,"accessToken":None}):
-        data = {}
-        updateStatus = ""
-        try:
-            itemSku = None
-            itemQty = None
-            dataList = []
+    # insert the entity_id into the mview changelog tables of an indexer, without committing, so that the database
+    # writers insert them within the transaction of the write itself (MAGENTO_REINDEX_MODE=changelog)
+    @staticmethod
+    def _insertReindexChangelogs(cursor, indexer, entityIds):
+        if not entityIds or config('MAGENTO_REINDEX_MODE', default='changelog') != 'changelog':
+            return
+        defaultChangelogs = {"price": "catalog_product_price_cl", "stock": "cataloginventory_stock_cl"}
+        changelogs = [table.strip() for table in config(f'MAGENTO_REINDEX_{indexer.upper()}_CHANGELOGS', default=defaultChangelogs.get(indexer, '')).split(',') if table.strip()]
+        for changelog in changelogs:
+            if not re.fullmatch(r"\w+", changelog):
+                raise Exception(f"Invalid changelog table name: {changelog}")
+            cursor.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s", (changelog,))
+            if not cursor.fetchone()[0]:
+                logging.warning(f"The changelog table {changelog} does not exist, is the indexer set to Update by Schedule?")
+                continue
+            cursor.executemany(f"INSERT INTO {changelog} (entity_id) VALUES (%s)", [(entityId,) for entityId in entityIds])
+
+    # submit a list of items as asynchronous bulk requests of at most `chunkSize` operations, at most `parallelism`
+    # at a time. It returns one dictionary {bulk_uuid, status, items} for each chunk: status is 'p' when Magento
+    # accepted the chunk, 'e' (with bulk_uuid None) when the submission failed
+    @staticmethod
+    def _submitBulkChunks(method, urlPath, itemList, toOperation, chunkSize=None, parallelism=None, options={"externalToken":False,"accessToken":None}):
+        chunkSize = chunkSize or config('MAGENTO_BULK_CHUNK_SIZE', default=1000, cast=int)
+        parallelism = parallelism or config('MAGENTO_BULK_PARALLELISM', default=4, cast=int)
+        chunks = [itemList[index:index + chunkSize] for index in range(0, len(itemList), chunkSize)]
 
-            for item in itemList:
-                itemSku = item["sku"]
-                itemQty = item["quantity"]
+        def submit(chunk):
+            response = MagentoHelper._call(method, urlPath, [toOperation(item) for item in chunk], options)
+            # the response return the uuid associated to the Cron's job that processes the queue
+            data = response.json() if response.status_code in [200, 201, 202] else {}
+            if not data or not data.get("bulk_uuid"):
+                raise Exception(f"Status Code: {response.status_code}, Response: {response.text}")
+            return data["bulk_uuid"]
+
+        bulkList = []
+        with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+            futures = {executor.submit(submit, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    bulkList.append({"bulk_uuid": future.result(), "status": 'p', "items": chunk})
+                except Exception as ex:
+                    logging.error(f"An exception has been thrown during a bulk update of {len(chunk)} Magento products: {str(ex)}")
+                    bulkList.append({"bulk_uuid": None, "status": 'e', "items": chunk})
+        return bulkList
+
+    # This rule bulk updates the price of a list of products, split into chunks submitted concurrently
+    def setPriceProductBulk(itemList, options={"externalToken":False,"accessToken":None}):
+        return MagentoHelper._submitBulkChunks(
+            "PUT",
+            "/rest/all/async/bulk/V1/products",
+            itemList,
+            lambda item: {
+                "product": {
+                    "sku": item["sku"],
+                    "price": item["price"]
+                }
+            },
+            options=options
+        )
 
-                dataList.append({
-                    "sourceItems": [
-                        {
-                            "sku": itemSku,
-                            "source_code": config("SOURCE_CODE_WHEREHOUSE"),
-                            "quantity": itemQty,
-                            "status": 0 if itemQty == 0 else 1
-                        }
-                    ]
-                })
+    # This rule bulk updates the quantity of a list of products, split into chunks submitted concurrently
+    def setStockProductBulk(itemList, options={"externalToken":False,"accessToken":None}, sourceCodes=None):
+        sourceCodes = sourceCodes or MagentoHelper.getStockSourceCodes()
+        return MagentoHelper._submitBulkChunks(
+            "POST",
+            "/rest/async/bulk/V1/inventory/source-items",
+            itemList,
+            lambda item: {
+                "sourceItems": [
+                    {
+                        "sku": item["sku"],
+                        "source_code": sourceCode,
+                        "quantity": item["quantity"],
+                        "status": 0 if item["quantity"] == 0 else 1
+                    }
+                    for sourceCode in sourceCodes
+                ]
+            },
+            options=options
+        )
 
-            response = MagentoHelper._call(
-                "POST",
-                "/rest/async/bulk/V1/inventory/source-items",
-                dataList,
-                options
-            )
+    # a generator of the status of the operations of a bulk on products, as (sku, status) couples: 'c' for the
+    # completed operations, 'e' for the failed ones and None for the ones still open (status 4). Only the fields
+    # read are requested and the serialized data of an operation is decoded only when the operation is done.
+    # It raises an exception when the request fails
+    @staticmethod
+    def iterBulkOpStatus(theUuid, options={"externalToken":False,"accessToken":None}, fields=BULK_STATUS_FIELDS):
+        response = MagentoHelper._call(
+            "GET",
+            f"/rest/all/V1/bulk/{theUuid}/detailed-status",
+            None,
+            options,
+            fields
+        )
+        if response.status_code != 200:
+            raise Exception(f"Failed to get the status of the bulk {theUuid}. Status Code: {response.status_code}, Response: {response.text}")
 
-            # the response return the uuid associated to the Cron's job that processes the queue
-            data = response.json()
-        except Exception as ex:
-            logging.error("An exception has been thrown during a bulk update of some Magento products", str(ex))
+        for operation in response.json().get("operations_list") or []:
+            if operation["status"] == 4:
+                yield None, None
+                continue
+            yield MagentoHelper._getBulkOperationSku(operation), 'c' if operation["status"] == 1 else 'e'
 
-        finally:
-            if data:
-                updateStatus = 'p'
-                return data["bulk_uuid"], updateStatus
-            else:
-                raise Exception
+    # the sku of an operation of a bulk on products: the payload is a product (price bulks) or the sourceItems array
+    # of a single sku (stock bulks, see setStockProductBulk)
+    @staticmethod
+    def _getBulkOperationSku(operation):
+        if operation["serialized_data"] is None:
+            data = json.loads(operation["result_serialized_data"])
+        else:
+            data = json.loads(json.loads(operation["serialized_data"])["meta_information"])
+        if data.get("product"):
+            return data["product"]["sku"]
+        if data.get("sourceItems"):
+            return data["sourceItems"][0]["sku"]
+        return data["sku"]
 
     # a method to request the status code of a bulk operation on products
     def getBulkOpStatusCode(theUuid, options={"externalToken":False,"accessToken":None}):
         updateStatusList = []
         try:
-
-            response = MagentoHelper._call(
-                "GET",
-                f"/rest/all/V1/bulk/{theUuid}/detailed-status",
-                None,
-                options
-            )
-
-            data = response.json()
-            for operation in data["operations_list"]:
-                if operation["serialized_data"] is None:
-                    item = json.loads(operation["result_serialized_data"])
-                    sku = item["sku"]
-                else:
-                    item = json.loads(operation["serialized_data"])
-                    meta=json.loads(item["meta_information"])
-                    product=meta["product"]
-                    sku = product['sku']
-
-                if operation["status"]==1:
-                    updateStatusList.append({"bulk_uuid":operation["bulk_uuid"], "sku":sku, "status":'c'})
-                elif operation["status"]!=4:
-                    updateStatusList.append({"bulk_uuid":operation["bulk_uuid"],"sku":sku, "status":'e'})
+            for sku, status in MagentoHelper.iterBulkOpStatus(theUuid, options):
+                if status:
+                    updateStatusList.append({"bulk_uuid":theUuid, "sku":sku, "status":status})
 
         except Exception as ex:
-            logging.error("An exception has been thrown during the request of a Magento bulk job status: ", str(ex))
+            logging.error(f"An exception has been thrown during the request of a Magento bulk job status: {str(ex)}")
 
         finally:
             return updateStatusList
@@ -395,10 +1011,10 @@ class MagentoHelper(SQLHelper):
         return response
 
     @staticmethod
-    def getOrder(orderId, options={"externalToken":False,"accessToken":None}):
+    def getOrder(orderId, options={"externalToken":False,"accessToken":None}, fields=ORDER_FIELDS):
         hasResponse = False
         try:
-            response = MagentoHelper._call("GET", f"/rest/V1/orders/{orderId}", None, options)
+            response = MagentoHelper._call("GET", f"/rest/V1/orders/{orderId}", None, options, fields)
             hasResponse = bool(response.status_code == 200)
         except Exception as ex:
             logging.error(f"Exception: {str(ex)}")
@@ -434,14 +1050,15 @@ class MagentoHelper(SQLHelper):
             return response.json()
 
     @staticmethod
-    def getShipmentsByOrderId(orderId, options={"externalToken":False,"accessToken":None}):
+    def getShipmentsByOrderId(orderId, options={"externalToken":False,"accessToken":None}, fields=SHIPMENTS_FIELDS):
         hasResponse = False
         try:
             response = MagentoHelper._call(
                 "GET",
                 f"/rest/V1/shipments?searchCriteria[filterGroups][0][filters][0][field]=order_id&searchCriteria[filterGroups][0][filters][0][value]={orderId}",
                 None,
-                options
+                options,
+                fields
             )
             hasResponse = bool(response.status_code == 200)
         except Exception as ex:
@@ -571,7 +1188,7 @@ class MagentoHelper(SQLHelper):
     # a method to get the credit memos
     # TODO: check if it is necessary to insert shop code inside the request url (value default by default, all for all or specific values)
     # TODO 2: check the returned fields of a call towards a credit memo in which only part of the order items has been refunded
-    def getCreditMemos(currentPage, options={"externalToken":False,"accessToken":None}):
+    def getCreditMemos(currentPage, options={"externalToken":False,"accessToken":None}, fields=CREDITMEMOS_FIELDS):
         data = {}
         tot_count = 0
         try:
@@ -579,7 +1196,8 @@ class MagentoHelper(SQLHelper):
                 "GET",
                 f"/rest/V1/creditmemos?searchCriteria[filter_groups][0][filters][0][field]=created_at&searchCriteria[filter_groups][0][filters][0][value]=1900-01-01&searchCriteria[filter_groups][0][filters][0][condition_type]=gteq&searchCriteria[pageSize]={config('MAGENTO_GET_CREDITMEMOS_PAGINATION')}&searchCriteria[currentPage]={currentPage}",
                 None,
-                options
+                options,
+                fields
             )
             if response.status_code == 200:
                 data = response.json()
@@ -0,0 +1,201 @@
+import logging
+import queue
+import threading
+import time
+
+class PipelineHelper:
+    """
+    Staged producer/consumer pipeline: a source feeds the first stage, every stage runs on its
+    own worker threads and hands its results to the next stage through a bounded queue, so that
+    the stages overlap and the wall-clock time approaches the one of the slowest stage
+    """
+
+    _END = object()
+
+    def __init__(self, queueSize=4, monitorInterval=0):
+        self.queueSize = max(1, int(queueSize))
+        self.monitorInterval = monitorInterval
+        self.stages = []
+        self.errors = []
+        self.sourceStats = {"name": "source", "items": 0, "busy_seconds": 0.0}
+        self.wallSeconds = 0.0
+        self._abort = threading.Event()
+        self._done = threading.Event()
+
+    def addStage(self, name, function, workers=1):
+        """
+        Append a stage to the pipeline
+
+        Args:
+            name (str): Stage name, used for the statistics and the thread names
+            function (callable): Called with every item of the stage, the returned value is
+                passed to the next stage (None drops the item)
+            workers (int): Number of worker threads of the stage
+
+        Returns:
+            PipelineHelper: The pipeline itself, so that the calls can be chained
+        """
+        self.stages.append({
+            "name": name,
+            "function": function,
+            "workers": max(1, int(workers)),
+            "queue": queue.Queue(maxsize=self.queueSize),
+            "lock": threading.Lock(),
+            "alive": 0,
+            "items": 0,
+            "busy_seconds": 0.0,
+            "wait_seconds": 0.0,
+            "max_queue_depth": 0
+        })
+        return self
+
+    def run(self, source, sourceName="source"):
+        """
+        Run the pipeline until the source is exhausted and every stage has drained its queue
+
+        Args:
+            source (iterable): Items fed to the first stage, consumed on a dedicated thread
+            sourceName (str): Name of the source in the statistics
+
+        Returns:
+            dict: Statistics of the run (see getStats)
+        """
+        if not self.stages:
+            raise Exception("The pipeline has no stages")
+
+        self.sourceStats["name"] = sourceName
+        threads = []
+        for index, stage in enumerate(self.stages):
+            stage["alive"] = stage["workers"]
+            for worker in range(stage["workers"]):
+                threads.append(threading.Thread(target=self._work, args=(index,), name=f"{stage['name']}-{worker}", daemon=True))
+        threads.append(threading.Thread(target=self._produce, args=(source,), name=sourceName, daemon=True))
+        if self.monitorInterval:
+            threading.Thread(target=self._monitor, name="monitor", daemon=True).start()
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wallSeconds = time.perf_counter() - start
+        self._done.set()
+
+        stats = self.getStats()
+        logging.info(f"Pipeline completed in {self.wallSeconds:.2f}s: {stats['stages']}")
+        if self.errors:
+            raise self.errors[0]
+        return stats
+
+    def getStats(self):
+        """
+        Current statistics of the pipeline: items processed, busy and waiting seconds of every
+        stage, current and maximum depth of its input queue
+
+        Returns:
+            dict: Statistics of the source and of each stage
+        """
+        return {
+            "wall_seconds": round(self.wallSeconds, 3),
+            "source": {
+                "name": self.sourceStats["name"],
+                "items": self.sourceStats["items"],
+                "busy_seconds": round(self.sourceStats["busy_seconds"], 3)
+            },
+            "stages": [
+                {
+                    "name": stage["name"],
+                    "workers": stage["workers"],
+                    "items": stage["items"],
+                    "busy_seconds": round(stage["busy_seconds"], 3),
+                    "wait_seconds": round(stage["wait_seconds"], 3),
+                    "queue_depth": stage["queue"].qsize(),
+                    "max_queue_depth": stage["max_queue_depth"]
+                }
+                for stage in self.stages
+            ],
+            "errors": [str(error) for error in self.errors]
+        }
+
+    def _put(self, stage, item):
+        # a blocking put that gives up when the pipeline is aborted
+        while not self._abort.is_set():
+            try:
+                stage["queue"].put(item, timeout=0.5)
+                with stage["lock"]:
+                    stage["max_queue_depth"] = max(stage["max_queue_depth"], stage["queue"].qsize())
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fail(self, name, ex):
+        logging.error(f"An exception has been thrown by the pipeline stage {name}: {str(ex)}")
+        self.errors.append(ex)
+        self._abort.set()
+
+    def _close(self, index):
+        # one end marker for each worker of the stage
+        stage = self.stages[index]
+        for _ in range(stage["workers"]):
+            if not self._put(stage, PipelineHelper._END):
+                return
+
+    def _produce(self, source):
+        try:
+            iterator = iter(source)
+            while not self._abort.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self.sourceStats["busy_seconds"] += time.perf_counter() - start
+                self.sourceStats["items"] += 1
+                if not self._put(self.stages[0], item):
+                    break
+        except Exception as ex:
+            self._fail(self.sourceStats["name"], ex)
+        finally:
+            self._close(0)
+
+    def _work(self, index):
+        stage = self.stages[index]
+        nextIndex = index + 1 if index + 1 < len(self.stages) else None
+        try:
+            while not self._abort.is_set():
+                start = time.perf_counter()
+                try:
+                    item = stage["queue"].get(timeout=0.5)
+                except queue.Empty:
+                    with stage["lock"]:
+                        stage["wait_seconds"] += time.perf_counter() - start
+                    continue
+                waited = time.perf_counter() - start
+                if item is PipelineHelper._END:
+                    break
+
+                start = time.perf_counter()
+                result = stage["function"](item)
+                with stage["lock"]:
+                    stage["wait_seconds"] += waited
+                    stage["busy_seconds"] += time.perf_counter() - start
+                    stage["items"] += 1
+
+                if nextIndex is not None and result is not None:
+                    if not self._put(self.stages[nextIndex], result):
+                        break
+        except Exception as ex:
+            self._fail(stage["name"], ex)
+        finally:
+            with stage["lock"]:
+                stage["alive"] -= 1
+                last = stage["alive"] == 0
+            # the last worker of a stage closes the next one
+            if last and nextIndex is not None:
+                self._close(nextIndex)
+
+    def _monitor(self):
+        while not self._done.wait(self.monitorInterval):
+            depths = ", ".join([f"{stage['name']}={stage['queue'].qsize()}" for stage in self.stages])
+            logging.debug(f"Pipeline queue depth: {depths}")
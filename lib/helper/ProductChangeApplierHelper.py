@@ -0,0 +1,115 @@
+import logging
+import datetime
+import time
+from decouple import config
+from lib.helper.BorderDbHelper import BorderDbHelper
+from lib.helper.StockPriceSyncHelper import StockPriceSyncHelper
+from lib.helper.StockPriceSyncManagerHelper import StockPriceSyncManager
+
+class ProductChangeApplier:
+    """
+    Micro-batch applier of the stock and price changes pushed by Eglem: every few seconds the pending
+    changes of product_change_queue are coalesced by product, compared with the snapshot and written
+    through the writers of the stock and price sync (database, api or bulk mode)
+    """
+
+    def __init__(self):
+        self.batchSize = config('PRODUCT_CHANGES_BATCH_SIZE', default=5000, cast=int)
+        self.intervalSeconds = config('PRODUCT_CHANGES_INTERVAL_SECONDS', default=5, cast=float)
+        # its writers and statistics are kept between the batches
+        self.manager = StockPriceSyncManager(eglem=False)
+        self.stats = {
+            'batches': 0,
+            'queued': 0,
+            'products': 0,
+            'unchanged': 0,
+            'unknown': 0,
+            'mismatched_sku': 0
+        }
+
+    def run(self):
+        """
+        Apply the pending changes every intervalSeconds, forever
+        """
+        while True:
+            start = time.monotonic()
+            try:
+                self.applyPending()
+            except Exception as ex:
+                logging.error(f"An exception has been thrown during the application of the product changes: {str(ex)}")
+            time.sleep(max(0, self.intervalSeconds - (time.monotonic() - start)))
+
+    def applyPending(self):
+        """
+        Apply the oldest pending changes, at most batchSize of them
+
+        Returns:
+            int: Number of queued changes processed
+        """
+        connection = BorderDbHelper.getConnection()
+        try:
+            queued = BorderDbHelper.getPendingProductChanges(self.batchSize, {"connection": connection, "close": False})
+            if not queued:
+                return 0
+
+            rowsByProduct = {}
+            for row in queued:
+                rowsByProduct.setdefault(str(row["id_eglem"]), []).append(row)
+
+            snapshots = BorderDbHelper.getProductSnapshotsByIdEglem(list(rowsByProduct.keys()), {"connection": connection, "close": False})
+            changes, appliedIds, unknownIds = [], [], []
+            for idEglem, rows in rowsByProduct.items():
+                snapshot = snapshots.get(idEglem)
+                if not snapshot:
+                    # a product never synced, it is written by the next full pass
+                    unknownIds.extend([row["id"] for row in rows])
+                    self.stats['unknown'] += 1
+                    continue
+                # the sku is the one synced for the id_eglem, a change pushed with a different sku is not applied
+                sku = snapshot["sku"]
+                mismatchedIds = [row["id"] for row in rows if row["sku"] and row["sku"] != sku]
+                if mismatchedIds:
+                    logging.error(f"{len(mismatchedIds)} changes of the id_eglem {idEglem} have been pushed with a sku different from {sku}, they are not applied")
+                    unknownIds.extend(mismatchedIds)
+                    self.stats['mismatched_sku'] += len(mismatchedIds)
+                rows = [row for row in rows if row["id"] not in mismatchedIds]
+                if not rows:
+                    continue
+                appliedIds.extend([row["id"] for row in rows])
+
+                # the changes of the same product are coalesced, the last value of each field wins
+                product = {"price": None, "quantity": None}
+                for row in rows:
+                    product["price"] = row["price"] if row["price"] is not None else product["price"]
+                    product["quantity"] = row["quantity"] if row["quantity"] is not None else product["quantity"]
+
+                # a value that has not been pushed keeps the one of the snapshot
+                price = StockPriceSyncHelper.normalizePrice(product["price"] if product["price"] is not None else snapshot["price"])
+                quantity = StockPriceSyncHelper.normalizeQuantity(product["quantity"] if product["quantity"] is not None else snapshot["quantity"])
+                priceChanged = price is not None and StockPriceSyncHelper.normalizePrice(snapshot["price"]) != price
+                quantityChanged = quantity is not None and StockPriceSyncHelper.normalizeQuantity(snapshot["quantity"]) != quantity
+                if not priceChanged and not quantityChanged:
+                    self.stats['unchanged'] += 1
+                    continue
+                changes.append({
+                    "sku": sku,
+                    "id_eglem": idEglem,
+                    "price": float(price) if price is not None else None,
+                    "quantity": quantity,
+                    "price_changed": priceChanged,
+                    "quantity_changed": quantityChanged
+                })
+
+            if changes:
+                self.manager.applyChanges(changes)
+            BorderDbHelper.updateProductChangesStatus(appliedIds, 'c', {"connection": connection, "close": False})
+            BorderDbHelper.updateProductChangesStatus(unknownIds, 'e', {"connection": connection, "close": False})
+
+            self.stats['batches'] += 1
+            self.stats['queued'] += len(queued)
+            self.stats['products'] += len(changes)
+            logging.info(f"Applied {len(queued)} queued changes as {len(changes)} product writes, {len(unknownIds)} changes of unknown products or with a wrong sku. Timestamp: {datetime.datetime.now()}")
+            return len(queued)
+
+        finally:
+            BorderDbHelper.connectionClose(connection)
@@ -1,20 +1,65 @@
 import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
 from decouple import config
 import logging
+import threading
 
 #Deprecated
 class SQLHelper():
 
+    # the connection pools of a long-running process (see enablePooling), by host, port, database and user
+    _pools = {}
+    _poolSize = 0
+    _poolLock = threading.Lock()
+
+    # from now on getConnection() returns pooled connections, whose close() gives them back to the pool,
+    # so that a long-running process reuses them between two runs of its jobs
+    @staticmethod
+    def enablePooling(size):
+        SQLHelper._poolSize = min(int(size), pooling.CNX_POOL_MAXSIZE)
+
+    # forget the pools, e.g. in a forked process, which must not share the connections of its parent
+    @staticmethod
+    def resetPooling():
+        with SQLHelper._poolLock:
+            SQLHelper._pools = {}
+
+    @staticmethod
+    def _getPooledConnection(host, port, database, user, password):
+        key = (host, port, database, user)
+        with SQLHelper._poolLock:
+            if key not in SQLHelper._pools:
+                SQLHelper._pools[key] = pooling.MySQLConnectionPool(
+                    pool_name=f"pool_{len(SQLHelper._pools)}",
+                    pool_size=SQLHelper._poolSize,
+                    host=host,
+                    port=port,
+                    database=database,
+                    user=user,
+                    password=password,
+                    use_pure=True
+                )
+            pool = SQLHelper._pools[key]
+        try:
+            return pool.get_connection()
+        except PoolError:
+            # every pooled connection is in use, a dedicated one is opened
+            return mysql.connector.connect(host=host, port=port, database=database, user=user, password=password, use_pure=True)
+
     def getConnection(host, port, database, user, password):
         try:
-            connection = mysql.connector.connect(
-                host=host,
-                port=port,
-                database=database,
-                user=user,
-                password=password,
-                use_pure=True
-            )
+            if SQLHelper._poolSize:
+                connection = SQLHelper._getPooledConnection(host, port, database, user, password)
+            else:
+                connection = mysql.connector.connect(
+                    host=host,
+                    port=port,
+                    database=database,
+                    user=user,
+                    password=password,
+                    use_pure=True
+                )
 
         except Exception as ex:
             logging.error("An exception has been thrown during the database connection: ", str(ex))
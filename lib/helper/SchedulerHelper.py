@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class SchedulerHelper:
+    """
+    Long-running scheduler: every job is registered with its own interval and is executed on a
+    pool of worker threads that lives as long as the scheduler, so that the modules, the pooled
+    connections and the HTTP sessions stay warm between two runs. A job is never started while
+    its previous run is still in progress
+    """
+
+    def __init__(self, workers=4, tickSeconds=1):
+        self.workers = max(1, int(workers))
+        self.tickSeconds = tickSeconds
+        self.jobs = []
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def addJob(self, name, function, seconds):
+        """
+        Register a job
+
+        Args:
+            name (str): Job name, used for the statistics and the logs
+            function (callable): Called without arguments at every run of the job
+            seconds (int): Seconds between the starts of two runs, 0 disables the job
+
+        Returns:
+            SchedulerHelper: The scheduler itself, so that the calls can be chained
+        """
+        if seconds and seconds > 0:
+            self.jobs.append({
+                "name": name,
+                "function": function,
+                "seconds": seconds,
+                "next_run": time.monotonic(),
+                "running": False,
+                "runs": 0,
+                "failures": 0,
+                "skipped": 0,
+                "last_seconds": 0.0,
+                "last_error": None
+            })
+        return self
+
+    def run(self):
+        """
+        Run the registered jobs until stop() is called
+        """
+        logging.info(f"Scheduler started with the jobs: {[(job['name'], job['seconds']) for job in self.jobs]}")
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job") as executor:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                for job in self.jobs:
+                    if now < job["next_run"]:
+                        continue
+                    with self.lock:
+                        if job["running"]:
+                            # the previous run is still in progress, this one is skipped
+                            job["skipped"] += 1
+                            job["next_run"] = now + job["seconds"]
+                            logging.warning(f"The job {job['name']} is still running, its run has been skipped")
+                            continue
+                        job["running"] = True
+                        job["next_run"] = now + job["seconds"]
+                    executor.submit(self._runJob, job)
+                self._stop.wait(self.tickSeconds)
+        logging.info(f"Scheduler stopped: {self.getStats()}")
+
+    def stop(self):
+        """
+        Stop the scheduler, the jobs in progress are completed
+        """
+        self._stop.set()
+
+    def getStats(self):
+        """
+        Statistics of the jobs: runs, failures, skipped runs, duration and error of the last run
+
+        Returns:
+            list: Statistics of each job
+        """
+        with self.lock:
+            return [
+                {key: job[key] for key in ("name", "seconds", "running", "runs", "failures", "skipped", "last_seconds", "last_error")}
+                for job in self.jobs
+            ]
+
+    def _runJob(self, job):
+        start = time.perf_counter()
+        error = None
+        try:
+            job["function"]()
+        except BaseException as ex:
+            # also SystemExit, so that a job calling exit() does not stop the scheduler
+            error = str(ex)
+            logging.error(f"An exception has been thrown by the job {job['name']}: {error}")
+        finally:
+            with self.lock:
+                job["running"] = False
+                job["runs"] += 1
+                job["failures"] += 1 if error is not None else 0
+                job["last_seconds"] = round(time.perf_counter() - start, 3)
+                job["last_error"] = error
+            logging.debug(f"The job {job['name']} completed in {job['last_seconds']}s")
@@ -0,0 +1,115 @@
+# This helper implements the comparison between the products retrieved from Eglem and
+# the last values pushed to Magento (product_snapshot table), so that only the changed rows are written
+import hashlib
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from decouple import config
+
+# the only fields of a Magento product used by the sync, kept in slots instead of the whole product json
+class ProductRecord:
+    __slots__ = ("sku", "id_eglem", "price")
+
+    def __init__(self, sku, idEglem, price):
+        self.sku = sku
+        self.id_eglem = idEglem
+        self.price = price
+
+
+class StockPriceSyncHelper:
+
+    # prices are compared as fixed-point decimals with this number of decimals, quantities as integers, so that
+    # the different representations returned by Eglem, Magento and the snapshot of the same value are equal
+    PRICE_DECIMALS = config('UPDATE_STOCK_AND_PRICE_PRICE_DECIMALS', default=2, cast=int)
+
+    # the shard of a product: CRC32 of its id_eglem modulo the number of shards, the same partition computed by
+    # MySQL with MOD(CRC32(id_eglem), count), so that it is stable between runs, processes and hosts
+    @staticmethod
+    def getShard(idEglem, count):
+        return zlib.crc32(str(idEglem).encode()) % count
+
+    # parse a shard option like "1/4" into the couple (index, count)
+    @staticmethod
+    def parseShard(value):
+        try:
+            index, count = [int(part) for part in value.split('/')]
+        except ValueError:
+            raise ValueError(f"Invalid shard {value}, expected index/count, e.g. 0/4")
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard {value}, the index must be between 0 and count - 1")
+        return index, count
+
+    # the canonical form of a price: a Decimal rounded to PRICE_DECIMALS decimals, None when missing
+    @staticmethod
+    def normalizePrice(value):
+        if value is None or value == '':
+            return None
+        if isinstance(value, str):
+            value = value.strip().replace(',', '.')
+        return Decimal(str(value)).quantize(Decimal(1).scaleb(-StockPriceSyncHelper.PRICE_DECIMALS), rounding=ROUND_HALF_UP)
+
+    # the canonical form of a quantity: an int, also from strings like "5.0000", None when missing
+    @staticmethod
+    def normalizeQuantity(value):
+        if value is None or value == '':
+            return None
+        return int(Decimal(str(value).strip()))
+
+    # the hash of the price and quantity pushed for a sku, used for a fast comparison against the snapshot
+    @staticmethod
+    def getProductHash(price, quantity):
+        price, quantity = StockPriceSyncHelper.normalizePrice(price), StockPriceSyncHelper.normalizeQuantity(quantity)
+        return hashlib.md5(f"{price}|{quantity}".encode()).hexdigest()
+
+    @staticmethod
+    def getSnapshotRow(sku, idEglem, price, quantity):
+        return {
+            "sku": sku,
+            "id_eglem": idEglem,
+            "price": StockPriceSyncHelper.normalizePrice(price),
+            "quantity": StockPriceSyncHelper.normalizeQuantity(quantity),
+            "hash": StockPriceSyncHelper.getProductHash(price, quantity)
+        }
+
+    # compare a product with its snapshot and return a couple of flags (priceChanged, quantityChanged).
+    # A missing snapshot, or one older than maxAgeHours (0 means never expires), counts as changed
+    @staticmethod
+    def getChanges(price, quantity, snapshot, maxAgeHours=0):
+        if not snapshot:
+            return True, True
+        if maxAgeHours and snapshot["timestamp"] < datetime.now() - timedelta(hours=maxAgeHours):
+            return True, True
+        if snapshot["hash"] == StockPriceSyncHelper.getProductHash(price, quantity):
+            return False, False
+
+        priceChanged = snapshot["price"] is None or StockPriceSyncHelper.normalizePrice(snapshot["price"]) != StockPriceSyncHelper.normalizePrice(price)
+        quantityChanged = snapshot["quantity"] is None or StockPriceSyncHelper.normalizeQuantity(snapshot["quantity"]) != StockPriceSyncHelper.normalizeQuantity(quantity)
+        return priceChanged, quantityChanged
+
+    # build the compact records of a page of Magento products (REST json), then empty the page so that the json
+    # is released at once. The position of the attribute within custom_attributes is usually the same for all
+    # the products of an attribute set, so the last position found is tried first and the list is scanned only on a miss
+    @staticmethod
+    def getProductRecords(magentoProducts, attribute='id_eglem'):
+        records = []
+        position = 0
+        for product in magentoProducts:
+            customAttributes = product.get("custom_attributes") or []
+            value = None
+            if position < len(customAttributes) and customAttributes[position].get("attribute_code") == attribute:
+                value = customAttributes[position].get("value")
+            else:
+                for index, customAttribute in enumerate(customAttributes):
+                    if customAttribute.get("attribute_code") == attribute:
+                        position, value = index, customAttribute.get("value")
+                        break
+            records.append(ProductRecord(product["sku"], value, product.get("price")))
+        magentoProducts.clear()
+        return records
+
+    # the same records from the rows of MagentoHelper.getEglemProductsDatabase(), which are released as well
+    @staticmethod
+    def getProductRecordsFromRows(rows):
+        records = [ProductRecord(row["sku"], row["id_eglem"], row["price"]) for row in rows]
+        rows.clear()
+        return records
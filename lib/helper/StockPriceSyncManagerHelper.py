@@ -0,0 +1,532 @@
+import logging
+import datetime
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decouple import config, Csv
+from lib.helper.SQLHelper import SQLHelper
+from lib.helper.MagentoHelper import MagentoHelper
+from lib.helper.EglemHelper import EglemClient
+from lib.helper.BorderDbHelper import BorderDbHelper
+from lib.helper.StockPriceSyncHelper import StockPriceSyncHelper
+from lib.helper.PipelineHelper import PipelineHelper
+
+class StockPriceSyncManager:
+    """
+    Manager class for the update of the products' price and stock quantity, executed as a
+    pipeline: Magento page fetcher -> Eglem enrichment -> diff -> writer
+    """
+
+    def __init__(self, resume=False, shard=None, lane='full', eglem=True):
+        # when enabled the last interrupted run is continued from its last checkpoint
+        self.resume = resume
+        # (index, count): only the products of this shard are synced, see StockPriceSyncHelper.getShard()
+        self.shard = shard
+        self.shardName = f"{shard[0]}/{shard[1]}" if shard else ''
+        # full: all the products, fast: only the hot ones (low stock, recently ordered, bestsellers), read from the
+        # Magento database whatever the product source is
+        self.lane = lane
+        self.hotProducts = {
+            "low_stock": config('UPDATE_STOCK_AND_PRICE_FAST_LANE_LOW_STOCK', default=5, cast=int),
+            "recent_minutes": config('UPDATE_STOCK_AND_PRICE_FAST_LANE_RECENT_MINUTES', default=60, cast=int),
+            "bestsellers_category_id": config('UPDATE_STOCK_AND_PRICE_FAST_LANE_BESTSELLERS_CATEGORY_ID', default=0, cast=int)
+        }
+        self.mode = config('UPDATE_STOCK_AND_PRICE_MODE_EXECUTION')
+        # where the Magento products are read from: api (REST product search) or database (Magento EAV tables)
+        self.productSource = config('UPDATE_STOCK_AND_PRICE_PRODUCT_SOURCE', default='api')
+        if shard and self.productSource != 'database':
+            # only the database source filters the shard on the server, with the api one every shard would download the whole catalog
+            raise Exception("The stock and price sync can be sharded only with UPDATE_STOCK_AND_PRICE_PRODUCT_SOURCE=database")
+        # when enabled only the products whose price or quantity changed since the last push are written
+        self.deltaOnly = config('UPDATE_STOCK_AND_PRICE_DELTA_ONLY', default=True, cast=bool)
+        # a snapshot older than this is pushed again anyway, 0 means that a snapshot never expires
+        self.snapshotMaxAgeHours = config('UPDATE_STOCK_AND_PRICE_SNAPSHOT_MAX_AGE_HOURS', default=24, cast=int)
+        self.queueSize = config('UPDATE_STOCK_AND_PRICE_PIPELINE_QUEUE_SIZE', default=4, cast=int)
+        self.eglemWorkers = config('UPDATE_STOCK_AND_PRICE_EGLEM_WORKERS', default=2, cast=int)
+        self.monitorInterval = config('UPDATE_STOCK_AND_PRICE_PIPELINE_MONITOR_SECONDS', default=0, cast=int)
+        # the database and bulk modes write the collected changes every flushPages pages or flushRows rows (0 disables the limit)
+        self.flushPages = config('UPDATE_STOCK_AND_PRICE_FLUSH_PAGES', default=0, cast=int)
+        self.flushRows = config('UPDATE_STOCK_AND_PRICE_FLUSH_ROWS', default=5000, cast=int)
+        # the websites whose prices and stocks are written by the database mode, all of them with the same Eglem data
+        self.priceWebsiteCodes = config('UPDATE_PRICE_WEBSITE_CODES', default=config('UPDATE_PRICE_WEBSITE_CODE'), cast=Csv())
+        self.stockWebsiteCodes = config('UPDATE_STOCK_WEBSITE_CODES', default=config('UPDATE_STOCK_WEBSITE_CODE'), cast=Csv())
+        self.stockWebsiteGroups = None
+        # the api mode sends the changes in batches of apiBatchSize skus for each call
+        self.apiBatchSize = config('MAGENTO_API_BATCH_SIZE', default=500, cast=int)
+
+        self.connectionBorder = None
+        self.connectionSnapshot = None
+        self.connectionMagento = None
+        # the Eglem requests are batched by their own adaptive size, independent of the Magento paging; a manager that
+        # only writes changes already known (applyChanges) is built without it
+        self.eglemClient = EglemClient() if eglem else None
+        # the products whose Eglem batch failed, with the pages they belong to, requested again after the pipeline
+        self.failedGroups = []
+        self.runId = None
+        self.firstPage = 1
+        self.lastPage = 0
+        self.pendingPages = []
+        self.committedPages = set()
+        self.baseCounts = {'products': 0, 'unchanged': 0, 'price_changed': 0, 'quantity_changed': 0}
+        self.itemListPrice, self.itemListQuantity = [], []
+        self.tuplePriceList, self.tupleQuantityList = [], []
+        self.snapshotList = []
+        self.apiChangeList = []
+        self.stats = {
+            'pages': 0,
+            'products': 0,
+            'unchanged': 0,
+            'price_changed': 0,
+            'quantity_changed': 0,
+            'suppressed_price_writes': 0,
+            'price_rows_modified': 0,
+            'stock_rows_modified': 0,
+            'flushes': 0,
+            'api_errors': 0,
+            'bulks': 0,
+            'eglem_failed_products': 0,
+            'eglem': {},
+            'pipeline': {}
+        }
+
+    def run(self):
+        """
+        Execute the update of price and stock
+
+        Returns:
+            dict: Statistics of the run
+        """
+        logging.debug(f"Start Process for update stock and price. Mode Exection:{self.mode}. Product source: {self.productSource}. Delta only: {self.deltaOnly}. Shard: {self.shardName or '-'}. Lane: {self.lane}. Timestamp: {datetime.datetime.now()}")
+        # the diff and the writer stages run on different threads, each one owns its connections
+        self.connectionBorder = BorderDbHelper.getConnection()
+        self.connectionSnapshot = BorderDbHelper.getConnection() if self.deltaOnly else None
+        try:
+            self.startRun()
+            if self.mode == 'database':
+                # the reindex notifications left pending by a previous run
+                self.notifyReindex('price', [])
+                self.notifyReindex('stock', [])
+            pipeline = PipelineHelper(self.queueSize, self.monitorInterval)
+            pipeline.addStage("eglem", self.enrichPage, self.eglemWorkers)
+            pipeline.addStage("diff", self.diffPage)
+            pipeline.addStage("writer", self.writePage)
+            try:
+                pipeline.run(self.fetchPages(), "magento")
+                self.retryFailedGroups()
+            finally:
+                self.stats['pipeline'] = pipeline.getStats()
+                self.stats['eglem'] = self.eglemClient.getStats()
+
+            logging.info(f"Products unchanged since the last push: {self.stats['unchanged']}, no-op price writes suppressed: {self.stats['suppressed_price_writes']}. Timestamp: {datetime.datetime.now()}")
+            self.flush()
+            if self.mode == 'database':
+                logging.info(f"Rows actually modified on Magento: price {self.stats['price_rows_modified']}, stock {self.stats['stock_rows_modified']}. Timestamp: {datetime.datetime.now()}")
+            # the pages of the products that Eglem never returned are not checkpointed, a resume requests them again
+            BorderDbHelper.updateSyncRun(self.runId, 'e' if self.failedGroups else 'c', self.lastPage, self.getCounts(), {"connection": self.connectionBorder, "close": False})
+        except Exception:
+            # the run stays resumable from its last checkpoint
+            if self.runId is not None:
+                BorderDbHelper.updateSyncRun(self.runId, 'e', self.lastPage, self.getCounts(), {"connection": self.connectionBorder, "close": False})
+            raise
+        finally:
+            if self.eglemClient:
+                self.eglemClient.close()
+            BorderDbHelper.connectionClose(self.connectionBorder)
+            BorderDbHelper.connectionClose(self.connectionSnapshot)
+            MagentoHelper.connectionClose(self.connectionMagento)
+            logging.debug(f"Finish Process. Timestamp: {datetime.datetime.now()}")
+        return self.stats
+
+    @staticmethod
+    def runShards(count, resume=False):
+        """
+        Execute the update of price and stock as count shards, each one in its own process with its own
+        Magento, Eglem and border database connections, then merge their statistics
+
+        Args:
+            count (int): Number of shards, the products are partitioned by the hash of their id_eglem
+            resume (bool): Whether each shard continues its last interrupted run
+
+        Returns:
+            dict: Merged statistics of the shards
+        """
+        statsList, errors = [], []
+        # fork, so that the processes inherit the configuration of the main script instead of importing it again
+        with ProcessPoolExecutor(max_workers=count, mp_context=multiprocessing.get_context('fork')) as executor:
+            futures = [executor.submit(StockPriceSyncManager._runShard, index, count, resume) for index in range(count)]
+            for index, future in enumerate(futures):
+                try:
+                    statsList.append(future.result())
+                except Exception as ex:
+                    logging.error(f"An exception has been thrown by the shard {index}/{count}: {str(ex)}")
+                    errors.append(f"{index}/{count}: {str(ex)}")
+
+        stats = StockPriceSyncManager.mergeStats(statsList)
+        if errors:
+            raise Exception(f"{len(errors)} of {count} shards failed ({'; '.join(errors)}), merged statistics of the others: {stats}")
+        return stats
+
+    @staticmethod
+    def _runShard(index, count, resume):
+        # the pooled database connections and the HTTP session of the parent process are not shared
+        SQLHelper.resetPooling()
+        MagentoHelper.resetSession()
+        return StockPriceSyncManager(resume=resume, shard=(index, count)).run()
+
+    @staticmethod
+    def runLanes(fastSeconds=None, fullSeconds=None):
+        """
+        Run forever the fast lane (hot products) every fastSeconds and the full pass every fullSeconds, each
+        lane on its own thread so that the fast lane keeps its cadence while a long full pass is running.
+        An interrupted full pass is resumed by the next one
+
+        Args:
+            fastSeconds (int): Seconds between the starts of two runs of the fast lane
+            fullSeconds (int): Seconds between the starts of two full passes
+        """
+        fastSeconds = fastSeconds or config('UPDATE_STOCK_AND_PRICE_FAST_LANE_SECONDS', default=60, cast=int)
+        fullSeconds = fullSeconds or config('UPDATE_STOCK_AND_PRICE_FULL_LANE_SECONDS', default=3600, cast=int)
+        lanes = [
+            threading.Thread(target=StockPriceSyncManager._runLane, args=('fast', fastSeconds), name="lane-fast", daemon=True),
+            threading.Thread(target=StockPriceSyncManager._runLane, args=('full', fullSeconds), name="lane-full", daemon=True)
+        ]
+        for lane in lanes:
+            lane.start()
+        for lane in lanes:
+            lane.join()
+
+    @staticmethod
+    def _runLane(lane, seconds):
+        while True:
+            start = time.monotonic()
+            try:
+                stats = StockPriceSyncManager(resume=(lane == 'full'), lane=lane).run()
+                logging.info(f"Update stock and price of the {lane} lane complete: {stats}. Timestamp: {datetime.datetime.now()}")
+            except Exception as ex:
+                logging.error(f"An exception has been thrown during the update of stock and price of the {lane} lane: {str(ex)}")
+            time.sleep(max(0, seconds - (time.monotonic() - start)))
+
+    # the sum of the numeric statistics of the shards, the statistics of each shard are kept under 'shards'
+    @staticmethod
+    def mergeStats(statsList):
+        merged = {}
+        for stats in statsList:
+            for key, value in stats.items():
+                if isinstance(value, (int, float)):
+                    merged[key] = merged.get(key, 0) + value
+        merged['shards'] = statsList
+        return merged
+
+    def applyChanges(self, changes):
+        """
+        Write a list of changes outside of a run (e.g. the ones pushed by Eglem), through the writers of the
+        configured mode
+
+        Args:
+            changes (list): Changes as dictionaries with sku, id_eglem, price, quantity, price_changed and
+                quantity_changed
+
+        Returns:
+            dict: Statistics of the writes
+        """
+        self.connectionBorder = BorderDbHelper.getConnection()
+        try:
+            self.writePage(([], changes))
+            self.flushChanges()
+        finally:
+            BorderDbHelper.connectionClose(self.connectionBorder)
+            MagentoHelper.connectionClose(self.connectionMagento)
+            self.connectionBorder, self.connectionMagento = None, None
+        return self.stats
+
+    # register the run into sync_run table, or continue the last one of the same mode when it did not complete
+    def startRun(self):
+        lastRun = BorderDbHelper.getLastSyncRun(self.mode, self.shardName, self.lane, {"connection": self.connectionBorder, "close": False}) if self.resume else None
+        if lastRun and lastRun["status"] != 'c':
+            self.runId = lastRun["id"]
+            self.lastPage = lastRun["last_page"]
+            self.baseCounts = {key: lastRun[key] for key in self.baseCounts}
+            logging.info(f"Resume of the sync run {self.runId} from page {self.lastPage + 1}. Timestamp: {datetime.datetime.now()}")
+        else:
+            self.runId = BorderDbHelper.insertSyncRun(self.mode, self.shardName, self.lane, {"connection": self.connectionBorder, "close": False})
+        self.firstPage = self.lastPage + 1
+        BorderDbHelper.updateSyncRun(self.runId, 'r', self.lastPage, self.getCounts(), {"connection": self.connectionBorder, "close": False})
+
+    # the counts of the run, including the ones of the interrupted run that has been resumed
+    def getCounts(self):
+        return {key: self.baseCounts[key] + self.stats[key] for key in self.baseCounts}
+
+    # mark the pages written by the last flush as committed and move the checkpoint forward. The pages complete
+    # out of order, so the checkpoint is the last page such that it and all the pages before it are committed
+    def checkpoint(self):
+        self.committedPages.update(self.pendingPages)
+        self.pendingPages = []
+        while self.lastPage + 1 in self.committedPages:
+            self.lastPage += 1
+            self.committedPages.discard(self.lastPage)
+        # the changes applied outside of a run (applyChanges) have no checkpoint
+        if self.runId is None:
+            return
+        BorderDbHelper.updateSyncRun(self.runId, 'r', self.lastPage, self.getCounts(), {"connection": self.connectionBorder, "close": False})
+
+    # source of the pipeline: consecutive Magento pages grouped until they fill at least one Eglem batch, so that
+    # the Eglem batch size does not depend on the Magento paging. Each item is (page numbers, products)
+    def fetchPages(self):
+        pageNumbers, products = [], []
+        for currentPage, magentoProducts in self.fetchMagentoPages():
+            pageNumbers.append(currentPage)
+            products.extend(magentoProducts)
+            if len(products) >= self.eglemClient.batchSize:
+                yield pageNumbers, products
+                pageNumbers, products = [], []
+        if pageNumbers:
+            yield pageNumbers, products
+
+    # the pages of the Magento products with an id_eglem, requested concurrently to the REST API (api) or
+    # streamed from the Magento database (database), as lists of ProductRecord (sku, id_eglem, price)
+    def fetchMagentoPages(self):
+        if self.lane == 'fast':
+            # the hot products are selected by a query on the Magento orders and stock
+            for currentPage, rows in MagentoHelper.getEglemProductsDatabase(firstPage=self.firstPage, shard=self.shard, hotProducts=self.hotProducts):
+                yield currentPage, StockPriceSyncHelper.getProductRecordsFromRows(rows)
+        elif self.productSource == 'database':
+            # the shard is filtered by the query itself
+            for currentPage, rows in MagentoHelper.getEglemProductsDatabase(firstPage=self.firstPage, shard=self.shard):
+                yield currentPage, StockPriceSyncHelper.getProductRecordsFromRows(rows)
+        else:
+            for currentPage, magentoProducts in MagentoHelper.getEglemProductsStream(firstPage=self.firstPage):
+                yield currentPage, StockPriceSyncHelper.getProductRecords(magentoProducts)
+
+    # first stage: retrieve the Eglem price and quantity of the products of a group of pages. When some batches
+    # fail their products are set aside with the pages, which are not passed on so that they are not checkpointed
+    def enrichPage(self, page):
+        pageNumbers, magentoProducts = page
+        productMap = {str(product.id_eglem): product for product in magentoProducts}
+        eglemProducts, failedBatches = self.eglemClient.getProducts(list(productMap.keys()))
+        if failedBatches:
+            self.failedGroups.append((pageNumbers, [productMap[idEglem] for batch in failedBatches for idEglem in batch]))
+            pageNumbers = []
+        return pageNumbers, productMap, eglemProducts
+
+    # request again, once, the products whose Eglem batches failed during the pipeline; the ones that fail again
+    # stay in failedGroups and keep their pages out of the checkpoint
+    def retryFailedGroups(self):
+        failedGroups, self.failedGroups = self.failedGroups, []
+        for pageNumbers, magentoProducts in failedGroups:
+            logging.info(f"Retry of {len(magentoProducts)} products of the pages {pageNumbers} not returned by Eglem. Timestamp: {datetime.datetime.now()}")
+            self.writePage(self.diffPage(self.enrichPage((pageNumbers, magentoProducts))))
+        self.stats['eglem_failed_products'] = sum([len(magentoProducts) for pageNumbers, magentoProducts in self.failedGroups])
+        if self.failedGroups:
+            logging.error(f"{self.stats['eglem_failed_products']} products have not been returned by Eglem, their pages will be requested again by a resume. Timestamp: {datetime.datetime.now()}")
+
+    # second stage: compare the Eglem values with the snapshot and keep only the changed products
+    def diffPage(self, page):
+        pageNumbers, productMap, eglemProducts = page
+        snapshots = BorderDbHelper.getProductSnapshots([product.sku for product in productMap.values()], {"connection": self.connectionSnapshot, "close": False}) if self.deltaOnly else {}
+
+        changes = []
+        for eglemProduct in eglemProducts:
+            idEg = eglemProduct['id']
+            magentoProduct = productMap[str(idEg)]
+            sku = magentoProduct.sku
+            # the values are compared in their canonical form, a Decimal price and an int quantity
+            price, quantity = StockPriceSyncHelper.normalizePrice(eglemProduct["prezzo"]), StockPriceSyncHelper.normalizeQuantity(eglemProduct["quantita"])
+
+            priceChanged, quantityChanged = StockPriceSyncHelper.getChanges(price, quantity, snapshots.get(sku), self.snapshotMaxAgeHours) if self.deltaOnly else (True, True)
+            if self.mode == 'database':
+                # the quantity written is the Eglem one net of the reserved quantity, which changes with the orders even
+                # when the Eglem one does not: it is always passed to the writer, whose comparison with inventory_source_item
+                # skips the source items already up to date
+                quantityChanged = True
+            if self.mode != 'database' and magentoProduct.price is not None:
+                # the price read from Magento decides the write, so that a manual change on Magento is overwritten and
+                # a price already on Magento is not written again (no snapshot, expired snapshot or DELTA_ONLY off)
+                magentoPriceChanged = price != StockPriceSyncHelper.normalizePrice(magentoProduct.price)
+                if not magentoPriceChanged and (priceChanged or eglemProduct["prezzo"] != magentoProduct.price):
+                    # a write that the snapshot or the comparison of the raw values would have made for nothing
+                    self.stats['suppressed_price_writes'] += 1
+                priceChanged = magentoPriceChanged
+            if not priceChanged and not quantityChanged:
+                self.stats['unchanged'] += 1
+                continue
+            changes.append({
+                "sku": sku,
+                "id_eglem": idEg,
+                # a float, so that it can be serialized into the json of the api and bulk requests
+                "price": float(price) if price is not None else None,
+                "quantity": quantity,
+                "price_changed": priceChanged,
+                "quantity_changed": quantityChanged
+            })
+
+        self.stats['pages'] += len(pageNumbers)
+        self.stats['products'] += len(eglemProducts)
+        return pageNumbers, changes
+
+    # last stage: collect the changes and write them in chunks
+    def writePage(self, page):
+        pageNumbers, changes = page
+        for change in changes:
+            sku, idEg, price, quantity = change["sku"], change["id_eglem"], change["price"], change["quantity"]
+            snapshotRow = StockPriceSyncHelper.getSnapshotRow(sku, idEg, price, quantity)
+            self.stats['price_changed'] += 1 if change["price_changed"] else 0
+            self.stats['quantity_changed'] += 1 if change["quantity_changed"] else 0
+
+            if self.mode == 'database':
+                if change["price_changed"]:
+                    self.tuplePriceList.append((sku, price))
+                    self.itemListPrice.append({"sku": sku, "id_eglem": idEg, "price": price, "quantity": None})
+                if change["quantity_changed"]:
+                    self.tupleQuantityList.append((sku, quantity))
+                    self.itemListQuantity.append({"sku": sku, "id_eglem": idEg, "price": None, "quantity": quantity})
+                self.snapshotList.append(snapshotRow)
+            elif self.mode == 'bulk':
+                if change["price_changed"]:
+                    self.itemListPrice.append({"sku": sku, "id_eglem": idEg, "price": price, "quantity": None})
+                if change["quantity_changed"]:
+                    self.itemListQuantity.append({"sku": sku, "id_eglem": idEg, "price": None, "quantity": quantity})
+                self.snapshotList.append(snapshotRow)
+            elif self.mode == 'api':
+                self.apiChangeList.append(change)
+
+        self.pendingPages.extend(pageNumbers)
+        if self.isFlushDue():
+            self.flush()
+        elif pageNumbers and not self.hasBufferedChanges():
+            # nothing of these pages waits to be written, so the checkpoint moves on without a flush
+            self.checkpoint()
+
+    # the collected changes are written every flushPages pages, or when they reach flushRows rows (apiBatchSize
+    # changes for the api mode)
+    def isFlushDue(self):
+        if self.flushPages and len(self.pendingPages) >= self.flushPages:
+            return True
+        if self.mode == 'api':
+            return len(self.apiChangeList) >= self.apiBatchSize
+        return bool(self.flushRows) and len(self.itemListPrice) + len(self.itemListQuantity) >= self.flushRows
+
+    def hasBufferedChanges(self):
+        if self.mode == 'api':
+            return bool(self.apiChangeList)
+        return bool(self.itemListPrice or self.itemListQuantity or self.snapshotList)
+
+    # write the changes collected by the database, api and bulk modes, then save the checkpoint
+    def flush(self):
+        self.flushChanges()
+        self.checkpoint()
+
+    def flushChanges(self):
+        if self.mode == 'database':
+            self.flushDatabase()
+        elif self.mode == 'api':
+            self.flushApi()
+        elif self.mode == 'bulk':
+            self.flushBulk()
+
+    # submit the changes collected by the bulk mode as chunked asynchronous bulk requests
+    def flushBulk(self):
+        failedSkus = set()
+        for itemList, setProductBulk in ((self.itemListPrice, MagentoHelper.setPriceProductBulk), (self.itemListQuantity, MagentoHelper.setStockProductBulk)):
+            if not itemList:
+                continue
+            # one product_history group for each submitted chunk, so that ProcessUpdateStatusBulk.py polls them separately
+            for bulk in setProductBulk(itemList):
+                BorderDbHelper.insertProductsHistory(bulk["items"], bulk["status"], bulk["bulk_uuid"], {"connection": self.connectionBorder, "close": False})
+                self.stats['bulks'] += 1
+                if bulk["status"] == 'e':
+                    failedSkus.update([item["sku"] for item in bulk["items"]])
+        # the operations that end with an error are removed from the snapshot by ProcessUpdateStatusBulk.py
+        BorderDbHelper.upsertProductSnapshots([snapshot for snapshot in self.snapshotList if snapshot["sku"] not in failedSkus], {"connection": self.connectionBorder, "close": False})
+        self.itemListPrice, self.itemListQuantity = [], []
+        self.snapshotList = []
+
+    # write the stock of every website of stockWebsiteGroups: the groups write different sources, so they are written
+    # concurrently, each one on its own connection, while the websites of a group are written in turn
+    def setStockDatabase(self, tupleQuantityList):
+        if self.stockWebsiteGroups is None:
+            self.stockWebsiteGroups = MagentoHelper.getStockWebsiteGroups(self.stockWebsiteCodes, {"connection": self.connectionMagento, "close": False}) if len(self.stockWebsiteCodes) > 1 else [self.stockWebsiteCodes]
+
+        # the websites of a group share their sources, so they are written by a single call that subtracts the
+        # reservations of all of them from each shared source item
+        def setStockGroup(websiteCodes, connection):
+            rowsModified, entityIds = MagentoHelper.setStockProductDatabase(tupleQuantityList, websiteCodes, config("STATUS_ORDER_FOR_EXCLUDE_QUANTITY"), config("METHOD_PAYMENT_FOR_EXCLUDE_QUANTITY"), {"connection": connection, "close": connection is None})
+            return rowsModified, set(entityIds)
+
+        if len(self.stockWebsiteGroups) == 1:
+            rowsModified, entityIds = setStockGroup(self.stockWebsiteGroups[0], self.connectionMagento)
+            return rowsModified, list(entityIds)
+
+        rowsModified, entityIds = 0, set()
+        with ThreadPoolExecutor(max_workers=len(self.stockWebsiteGroups)) as executor:
+            for groupRows, groupEntityIds in executor.map(lambda websiteCodes: setStockGroup(websiteCodes, None), self.stockWebsiteGroups):
+                rowsModified += groupRows
+                entityIds.update(groupEntityIds)
+        return rowsModified, list(entityIds)
+
+    # write the price and stock changes collected so far by the database mode, each write is committed in its
+    # own transaction, then release them so that the memory does not grow with the catalog
+    def flushDatabase(self):
+        if self.tuplePriceList or self.tupleQuantityList:
+            if not self.connectionMagento:
+                self.connectionMagento = MagentoHelper.getConnection()
+            # INSERT PRICE
+            if self.tuplePriceList:
+                rowsModified, entityIds = MagentoHelper.setPriceProductDatabase(self.tuplePriceList, self.priceWebsiteCodes, config('UPDATE_PRICE_GLOBAL_WEBSITE_CODE'), {"connection": self.connectionMagento, "close": False})
+                self.stats['price_rows_modified'] += rowsModified
+                self.notifyReindex('price', entityIds)
+                BorderDbHelper.insertProductsHistory(self.itemListPrice, 'c', None, {"connection": self.connectionBorder, "close": False})
+                logging.info(f"Update Price of {len(self.tuplePriceList)} products complete. Timestamp: {datetime.datetime.now()}")
+            # INSERT QUANTITY
+            if self.tupleQuantityList:
+                rowsModified, entityIds = self.setStockDatabase(self.tupleQuantityList)
+                self.stats['stock_rows_modified'] += rowsModified
+                self.notifyReindex('stock', entityIds)
+                BorderDbHelper.insertProductsHistory(self.itemListQuantity, 'c', None, {"connection": self.connectionBorder, "close": False})
+                logging.info(f"Update Stock of {len(self.tupleQuantityList)} products complete. Timestamp: {datetime.datetime.now()}")
+            BorderDbHelper.upsertProductSnapshots(self.snapshotList, {"connection": self.connectionBorder, "close": False})
+            self.stats['flushes'] += 1
+
+        self.itemListPrice, self.itemListQuantity = [], []
+        self.tuplePriceList, self.tupleQuantityList = [], []
+        self.snapshotList = []
+
+    # with MAGENTO_REINDEX_MODE=command run the reindex command on the entity_id written by the database mode, together
+    # with the ones left pending by a failed notification; they are kept into pending_reindex until the command
+    # succeeds, so that a failure is retried by the next flush or run instead of being lost. With the changelog
+    # mode there is nothing to do, the changelog rows are committed by the writes themselves
+    def notifyReindex(self, indexer, entityIds):
+        if config('MAGENTO_REINDEX_MODE', default='changelog') != 'command':
+            return
+        BorderDbHelper.insertPendingReindex(indexer, entityIds, {"connection": self.connectionBorder, "close": False})
+        pendingIds = BorderDbHelper.getPendingReindex(indexer, {"connection": self.connectionBorder, "close": False})
+        if not pendingIds:
+            return
+        try:
+            MagentoHelper.notifyReindex(indexer, pendingIds)
+            BorderDbHelper.deletePendingReindex(indexer, pendingIds, options={"connection": self.connectionBorder, "close": False})
+        except Exception as ex:
+            logging.error(f"The {indexer} reindex of {len(pendingIds)} products has failed, it will be retried by the next flush: {str(ex)}")
+
+    # write the changes collected by the api mode with batched calls, the result of each sku is recorded into
+    # product_history, and a sku with a failed write keeps its old snapshot so that it is pushed again by the next run
+    def flushApi(self):
+        changes, self.apiChangeList = self.apiChangeList, []
+        if not changes:
+            return
+        itemListPrice = [{"sku": change["sku"], "id_eglem": change["id_eglem"], "price": change["price"], "quantity": None} for change in changes if change["price_changed"]]
+        itemListQuantity = [{"sku": change["sku"], "id_eglem": change["id_eglem"], "price": None, "quantity": change["quantity"]} for change in changes if change["quantity_changed"]]
+
+        updateStatusPrice = MagentoHelper.setPriceProducts(itemListPrice, self.apiBatchSize) if itemListPrice else {}
+        updateStatusQuantity = MagentoHelper.setStockProducts(itemListQuantity, self.apiBatchSize) if itemListQuantity else {}
+        for itemList, updateStatusMap in ((itemListPrice, updateStatusPrice), (itemListQuantity, updateStatusQuantity)):
+            for updateStatus in set(updateStatusMap.values()):
+                BorderDbHelper.insertProductsHistory([item for item in itemList if updateStatusMap.get(item["sku"]) == updateStatus], updateStatus, None, {"connection": self.connectionBorder, "close": False})
+
+        snapshotList = [
+            StockPriceSyncHelper.getSnapshotRow(change["sku"], change["id_eglem"], change["price"], change["quantity"])
+            for change in changes
+            if updateStatusPrice.get(change["sku"], 'c') == 'c' and updateStatusQuantity.get(change["sku"], 'c') == 'c'
+        ]
+        BorderDbHelper.upsertProductSnapshots(snapshotList, {"connection": self.connectionBorder, "close": False})
+        self.stats['api_errors'] += len(changes) - len(snapshotList)
@@ -0,0 +1,138 @@
+import logging
+import datetime
+import math
+import time
+import numpy as np
+import pandas as pd
+from decouple import config, Csv
+from lib.helper.MagentoHelper import MagentoHelper
+from lib.helper.EglemHelper import EglemClient
+from lib.helper.BorderDbHelper import BorderDbHelper
+from lib.helper.StockPriceSyncHelper import StockPriceSyncHelper
+
+class StockPriceSyncReport:
+    """
+    Dry run of the stock and price sync: the Magento catalog, the Eglem data and the product snapshot
+    are loaded into DataFrames, the whole diff is computed with vectorized operations and written to
+    a report file, without writing anything to Magento
+    """
+
+    def __init__(self, reportFile=None):
+        self.reportFile = reportFile or config('UPDATE_STOCK_AND_PRICE_DRY_RUN_REPORT', default='stock_price_dry_run.csv')
+        self.decimals = StockPriceSyncHelper.PRICE_DECIMALS
+        self.apiBatchSize = config('MAGENTO_API_BATCH_SIZE', default=500, cast=int)
+        self.bulkChunkSize = config('MAGENTO_BULK_CHUNK_SIZE', default=1000, cast=int)
+        self.flushRows = config('UPDATE_STOCK_AND_PRICE_FLUSH_ROWS', default=5000, cast=int)
+        self.eglemClient = EglemClient()
+
+    def run(self):
+        """
+        Compute the diff between Magento and Eglem and write the report
+
+        Returns:
+            dict: Summary of the diff and estimate of the writes that a run would make
+        """
+        start = time.perf_counter()
+        try:
+            magento = self.loadMagento()
+            eglem, eglemFailed = self.loadEglem(magento["id_eglem"].drop_duplicates().tolist())
+            snapshot = self.loadSnapshot()
+            reserved = self.loadReserved()
+        finally:
+            self.eglemClient.close()
+
+        report, summary = self.getDiff(magento, eglem, snapshot, reserved)
+        report.to_csv(self.reportFile, index=False)
+        summary["eglem_failed_ids"] = eglemFailed
+        summary["report_file"] = self.reportFile
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        logging.info(f"Dry run of the update of stock and price complete: {summary}. Timestamp: {datetime.datetime.now()}")
+        return summary
+
+    # the Magento products with an id_eglem, with their global price and their quantity on SOURCE_CODE_WHEREHOUSE,
+    # read by the database product source because the REST search has no quantities
+    def loadMagento(self):
+        rows = []
+        for currentPage, pageRows in MagentoHelper.getEglemProductsDatabase():
+            rows.extend([(row["sku"], str(row["id_eglem"]), row["price"], row["quantity"]) for row in pageRows])
+        magento = pd.DataFrame.from_records(rows, columns=["sku", "id_eglem", "magento_price", "magento_quantity"])
+        magento["magento_price"] = self._toPrice(magento["magento_price"])
+        magento["magento_quantity"] = self._toQuantity(magento["magento_quantity"])
+        return magento
+
+    # the Eglem price and quantity of a list of ids, and the number of ids whose batches failed
+    def loadEglem(self, idList):
+        products, failedBatches = self.eglemClient.getProducts(idList)
+        eglem = pd.DataFrame.from_records(
+            [(str(product["id"]), product["prezzo"], product["quantita"]) for product in products],
+            columns=["id_eglem", "eglem_price", "eglem_quantity"]
+        ).drop_duplicates("id_eglem", keep="last")
+        eglem["eglem_price"] = self._toPrice(eglem["eglem_price"])
+        eglem["eglem_quantity"] = self._toQuantity(eglem["eglem_quantity"])
+        return eglem, sum([len(batch) for batch in failedBatches])
+
+    # the quantity reserved on SOURCE_CODE_WHEREHOUSE for each sku by the websites whose stock is written, brought up to
+    # date first, so that the Eglem quantity is compared net of it as the database mode writes it
+    def loadReserved(self):
+        MagentoHelper.refreshReservedQuantity(config("STATUS_ORDER_FOR_EXCLUDE_QUANTITY"), config("METHOD_PAYMENT_FOR_EXCLUDE_QUANTITY"))
+        websiteCodes = config('UPDATE_STOCK_WEBSITE_CODES', default=config('UPDATE_STOCK_WEBSITE_CODE'), cast=Csv())
+        reserved = pd.DataFrame.from_records(
+            MagentoHelper.getReservedQuantities(websiteCodes, config("SOURCE_CODE_WHEREHOUSE")),
+            columns=["sku", "reserved_quantity"]
+        )
+        reserved["reserved_quantity"] = pd.to_numeric(reserved["reserved_quantity"], errors="coerce")
+        return reserved
+
+    def loadSnapshot(self):
+        return pd.DataFrame.from_records(
+            [(row["sku"], row["id_eglem"]) for row in BorderDbHelper.getAllProductSnapshots()],
+            columns=["sku", "id_eglem"]
+        )
+
+    # the vectorized diff: one report row for each product with at least one difference
+    def getDiff(self, magento, eglem, snapshot, reserved):
+        frame = magento.merge(eglem, on="id_eglem", how="left", indicator=True).merge(reserved, on="sku", how="left")
+        both = frame["_merge"] == "both"
+        # the quantity that the writer would store: the Eglem one net of the reserved quantity, never below zero
+        frame["reserved_quantity"] = frame["reserved_quantity"].fillna(0)
+        frame["eglem_net_quantity"] = self._toQuantity((frame["eglem_quantity"].astype("Float64") - frame["reserved_quantity"]).clip(lower=0))
+        frame["price_changed"] = both & ~self._equal(frame["magento_price"], frame["eglem_price"])
+        frame["quantity_changed"] = both & ~self._equal(frame["magento_quantity"], frame["eglem_net_quantity"])
+        frame["out_of_stock"] = both & (frame["magento_quantity"].fillna(0) > 0) & (frame["eglem_net_quantity"].fillna(0) <= 0)
+        frame["back_in_stock"] = both & (frame["magento_quantity"].fillna(0) <= 0) & (frame["eglem_net_quantity"].fillna(0) > 0)
+        frame["missing_on_eglem"] = ~both
+        frame["missing_on_magento"] = False
+        frame = frame.drop(columns="_merge")
+
+        # the products pushed in the past that are no longer among the Magento products with an id_eglem
+        missing = snapshot[~snapshot["sku"].isin(magento["sku"])].assign(missing_on_magento=True)
+        flags = ["price_changed", "quantity_changed", "out_of_stock", "back_in_stock", "missing_on_eglem", "missing_on_magento"]
+        report = pd.concat([frame[frame[flags].any(axis=1)], missing], ignore_index=True)
+        report[flags] = report[flags].fillna(False).astype(bool)
+
+        priceWrites, stockWrites = int(frame["price_changed"].sum()), int(frame["quantity_changed"].sum())
+        summary = {
+            "products": len(magento),
+            "eglem_products": len(eglem),
+            **{flag: int(report[flag].sum()) for flag in flags},
+            "unchanged": int((both & ~frame["price_changed"] & ~frame["quantity_changed"]).sum()),
+            # the writes that a run without snapshot would make, in calls, bulk chunks and database flushes
+            "api_calls": math.ceil(priceWrites / self.apiBatchSize) + math.ceil(stockWrites / self.apiBatchSize),
+            "bulk_chunks": math.ceil(priceWrites / self.bulkChunkSize) + math.ceil(stockWrites / self.bulkChunkSize),
+            "database_flushes": math.ceil((priceWrites + stockWrites) / self.flushRows) if self.flushRows else 1
+        }
+        return report, summary
+
+    # two columns are equal when both values are missing or when they are the same
+    @staticmethod
+    def _equal(left, right):
+        return (left == right) | (left.isna() & right.isna())
+
+    # the vectorized StockPriceSyncHelper.normalizePrice: numbers rounded to the compared decimals
+    def _toPrice(self, series):
+        return pd.to_numeric(series.astype("string").str.strip().str.replace(",", ".", regex=False), errors="coerce").round(self.decimals)
+
+    # the vectorized StockPriceSyncHelper.normalizeQuantity: nullable integers
+    @staticmethod
+    def _toQuantity(series):
+        return np.trunc(pd.to_numeric(series.astype("string").str.strip(), errors="coerce")).astype("Int64")
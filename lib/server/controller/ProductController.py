@@ -0,0 +1,29 @@
+# The controllers used by the server proxy
+from lib.helper.BorderDbHelper import BorderDbHelper
+from lib.server.model.ResponseHttpModel import ResponseHttp
+from fastapi import HTTPException
+
+
+class ProductController:
+
+    # queue the stock and price changes pushed by Eglem into product_change_queue table, they are applied
+    # to Magento by ProcessProductChanges.py within a few seconds
+    @staticmethod
+    def pushChanges(changes):
+        if changes is None:
+            raise HTTPException(status_code=415, detail="Dati non validi")
+        if not isinstance(changes, list):
+            changes = [changes]
+        changes = [change for change in changes if change.prezzo is not None or change.quantita is not None]
+        if not changes:
+            raise HTTPException(status_code=415, detail="Dati non validi")
+
+        try:
+            rowCount = BorderDbHelper.insertProductChanges([
+                {"id_eglem": change.id, "sku": change.sku, "price": change.prezzo, "quantity": change.quantita}
+                for change in changes
+            ])
+            response = ResponseHttp(status_code = 202, content = {'message': f"{rowCount} variazioni accodate correttamente", 'data': {'queued': rowCount}}).model_dump()
+        except Exception as e:
+            response = ResponseHttp(status_code = 500, content = {'message': str(e)}).model_dump()
+        return response
@@ -0,0 +1,11 @@
+# Define the data models
+from pydantic import BaseModel
+from typing import Optional
+from decimal import Decimal
+
+# a stock and/or price change of an Eglem product, with the same field names of the Eglem product lists
+class ProductChange(BaseModel):
+    id: int
+    sku: Optional[str] = None
+    prezzo: Optional[Decimal] = None
+    quantita: Optional[int] = None
@@ -0,0 +1,52 @@
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+from lib.helper.MagentoHelper import MagentoHelper
+
+
+def operation(status, meta=None, result=None):
+    return {
+        "status": status,
+        "serialized_data": json.dumps({"meta_information": json.dumps(meta)}) if meta is not None else None,
+        "result_serialized_data": json.dumps(result) if result is not None else None
+    }
+
+
+class TestBulkOpStatus(unittest.TestCase):
+
+    def getStatuses(self, operations):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"operations_list": operations}
+        with patch.object(MagentoHelper, "_call", return_value=response):
+            return list(MagentoHelper.iterBulkOpStatus("uuid"))
+
+    def test_price_bulk(self):
+        statuses = self.getStatuses([
+            operation(1, meta={"product": {"sku": "A", "price": 10}}),
+            operation(2, meta={"product": {"sku": "B", "price": 20}})
+        ])
+        self.assertEqual(statuses, [("A", 'c'), ("B", 'e')])
+
+    def test_stock_bulk(self):
+        statuses = self.getStatuses([
+            operation(1, meta={"sourceItems": [{"sku": "C", "source_code": "CS", "quantity": 3, "status": 1}]}),
+            operation(3, meta={"sourceItems": [{"sku": "D", "source_code": "CS", "quantity": 0, "status": 0}]})
+        ])
+        self.assertEqual(statuses, [("C", 'c'), ("D", 'e')])
+
+    def test_result_payload_and_open_operations(self):
+        statuses = self.getStatuses([
+            operation(1, result={"sku": "E"}),
+            operation(4, meta={"sourceItems": [{"sku": "F"}]})
+        ])
+        self.assertEqual(statuses, [("E", 'c'), (None, None)])
+
+    def test_failed_request(self):
+        response = MagicMock(status_code=500, text="error")
+        with patch.object(MagentoHelper, "_call", return_value=response):
+            with self.assertRaises(Exception):
+                list(MagentoHelper.iterBulkOpStatus("uuid"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,7 +9,19 @@ class CreateBorderDB:
             connection = options["connection"] if options["connection"] else SQLHelper.getConnection()
             cursor = connection.cursor()
             cursor.execute("CREATE DATABASE eglem CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci")
-            sqlCreateTable = "CREATE TABLE eglem.product_history (id int NOT NULL AUTO_INCREMENT, sku varchar(100), id_eglem varchar(100), quantity varchar(11), price float(7,2), timestamp datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, status varchar(100), jobuuid varchar(100), PRIMARY KEY (id));"
+            sqlCreateTable = "CREATE TABLE eglem.product_history (id int NOT NULL AUTO_INCREMENT, sku varchar(100), id_eglem varchar(100), quantity varchar(11), price float(7,2), timestamp datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, status varchar(100), jobuuid varchar(100), PRIMARY KEY (id), KEY idx_product_history_jobuuid_sku (jobuuid, sku), KEY idx_product_history_status (status, jobuuid));"
+            cursor.execute(sqlCreateTable)
+            # last price/quantity pushed to Magento for each sku, used by the delta-only stock and price sync
+            sqlCreateTable = "CREATE TABLE eglem.product_snapshot (sku varchar(100) NOT NULL, id_eglem varchar(100), price decimal(12,4), quantity int(11), hash char(32), timestamp datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (sku), KEY idx_product_snapshot_id_eglem (id_eglem));"
+            cursor.execute(sqlCreateTable)
+            # durable queue of the stock and price changes pushed by Eglem to ServerAPI.py, applied by ProcessProductChanges.py
+            sqlCreateTable = "CREATE TABLE eglem.product_change_queue (id bigint NOT NULL AUTO_INCREMENT, id_eglem varchar(100) NOT NULL, sku varchar(100), price decimal(12,4), quantity int(11), status varchar(1) NOT NULL DEFAULT 'p', received_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, processed_at datetime, PRIMARY KEY (id), KEY idx_product_change_queue_status (status, id));"
+            cursor.execute(sqlCreateTable)
+            # run state of the stock and price sync, used to resume an interrupted run from its last checkpoint
+            sqlCreateTable = "CREATE TABLE eglem.sync_run (id int NOT NULL AUTO_INCREMENT, mode varchar(20), shard varchar(10) NOT NULL DEFAULT '', lane varchar(10) NOT NULL DEFAULT 'full', status varchar(1), last_page int NOT NULL DEFAULT 0, products int NOT NULL DEFAULT 0, unchanged int NOT NULL DEFAULT 0, price_changed int NOT NULL DEFAULT 0, quantity_changed int NOT NULL DEFAULT 0, started_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, timestamp datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP, PRIMARY KEY (id), KEY idx_sync_run_mode (mode, shard, lane, id));"
+            cursor.execute(sqlCreateTable)
+            # entity_id written by the database mode whose reindex command has not run yet, retried by the next run
+            sqlCreateTable = "CREATE TABLE eglem.pending_reindex (indexer varchar(20) NOT NULL, entity_id int unsigned NOT NULL, timestamp datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (indexer, entity_id));"
             cursor.execute(sqlCreateTable)
             connection.commit()
 
@@ -1,2 +1,12 @@
 CREATE DATABASE eglem CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
-CREATE TABLE eglem.product_history (id int NOT NULL AUTO_INCREMENT, sku varchar(100), id_eglem int(11), quantity varchar(11), price float(7,2), timestamp datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, status varchar(100), jobuuid varchar(100), PRIMARY KEY (id));
\ No newline at end of file
+CREATE TABLE eglem.product_history (id int NOT NULL AUTO_INCREMENT, sku varchar(100), id_eglem int(11), quantity varchar(11), price float(7,2), timestamp datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, status varchar(100), jobuuid varchar(100), PRIMARY KEY (id));
+CREATE TABLE eglem.product_snapshot (sku varchar(100) NOT NULL, id_eglem varchar(100), price decimal(12,4), quantity int(11), hash char(32), timestamp datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (sku), KEY idx_product_snapshot_id_eglem (id_eglem));
+
+CREATE TABLE eglem.product_change_queue (id bigint NOT NULL AUTO_INCREMENT, id_eglem varchar(100) NOT NULL, sku varchar(100), price decimal(12,4), quantity int(11), status varchar(1) NOT NULL DEFAULT 'p', received_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, processed_at datetime, PRIMARY KEY (id), KEY idx_product_change_queue_status (status, id));
+
+CREATE TABLE eglem.sync_run (id int NOT NULL AUTO_INCREMENT, mode varchar(20), shard varchar(10) NOT NULL DEFAULT '', lane varchar(10) NOT NULL DEFAULT 'full', status varchar(1), last_page int NOT NULL DEFAULT 0, products int NOT NULL DEFAULT 0, unchanged int NOT NULL DEFAULT 0, price_changed int NOT NULL DEFAULT 0, quantity_changed int NOT NULL DEFAULT 0, started_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, timestamp datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP, PRIMARY KEY (id), KEY idx_sync_run_mode (mode, shard, lane, id));
+
+CREATE TABLE eglem.pending_reindex (indexer varchar(20) NOT NULL, entity_id int unsigned NOT NULL, timestamp datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (indexer, entity_id));
+
+-- indexes of the bulk status updates of product_history (also the only statement to run on the databases created before them)
+ALTER TABLE eglem.product_history ADD KEY idx_product_history_jobuuid_sku (jobuuid, sku), ADD KEY idx_product_history_status (status, jobuuid);